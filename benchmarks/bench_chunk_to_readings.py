@@ -0,0 +1,131 @@
+""" Micro-benchmark for CSVReader.chunk_to_readings
+
+Compares the columnar reading builder with the former row by row loop
+(to_dict('records') + one str() per timestamp + timestamp.pop(0)) and checks
+both produce the same readings, timestamp strings included.
+
+Usage
+python3 benchmarks/bench_chunk_to_readings.py
+or
+python3 benchmarks/bench_chunk_to_readings.py --rows 100000 --cols 4 --repeat 5
+
+"""
+
+import argparse
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(_HERE, 'stubs'), os.path.join(_HERE, '..', 'python')]
+
+import numpy as np
+import pandas as pd
+
+from fledge.plugins.common import utils
+from fledge.plugins.south.csvplayback import csvplayback
+
+_TS_FORMAT = '%Y-%m-%d %H:%M:%S.%f%z'
+
+
+def legacy_chunk_to_readings(reader, chunk):
+    """ The row by row conversion used before the columnar builder, kept here as the baseline """
+    timestamp = []
+    if (reader.ts_col != '') and (reader.ts_col in chunk) and (reader.is_historic_ts or reader.is_delta_ts):
+        if reader.is_historic_ts:
+            timestamp = list(pd.to_datetime(chunk[reader.ts_col], format=_TS_FORMAT).array)
+            if reader.is_drop_ts:
+                chunk = chunk.drop(columns=reader.ts_col)
+        else:
+            if reader.ts_diff is None:
+                ts_array = list(pd.to_datetime(chunk[reader.ts_col], format=_TS_FORMAT).array)
+                reader.ts_diff = ts_array[1] - ts_array[0]
+            for _ in range(chunk.shape[0]):
+                timestamp.append(reader.c)
+                reader.c = reader.c + reader.ts_diff
+    else:
+        now_timestamp = datetime.datetime.now(datetime.timezone.utc).astimezone()
+        uniform_interval = int(1.0 / (max(1.0, len(chunk))) * 1000000)
+        useconds = 0
+
+    readings = []
+    for row_values in chunk.to_dict('records'):
+        if reader.is_burst:
+            modified_timestamp = str(utils.local_timestamp())
+        elif len(timestamp) != 0:
+            modified_timestamp = str(timestamp.pop(0))
+        else:
+            modified_timestamp = str(now_timestamp.replace(microsecond=useconds))
+            useconds += uniform_interval
+        readings.append({'asset': reader.asset_name, 'timestamp': modified_timestamp, 'readings': row_values})
+    return readings
+
+
+def make_chunk(rows, cols):
+    start = pd.Timestamp('2024-01-01 00:00:00', tz='UTC')
+    data = {'channel{}'.format(i + 1): np.random.random(rows) for i in range(cols)}
+    stamps = start + pd.to_timedelta(np.arange(rows) * 125, unit='us')
+    data['ts'] = stamps.strftime('%Y-%m-%d %H:%M:%S.%f+00:00')
+    return pd.DataFrame(data)
+
+
+def make_reader(csv_dir, style):
+    config = {k: {'value': v['default']} for k, v in csvplayback._DEFAULT_CONFIG.items()}
+    config['csvDirName']['value'] = csv_dir
+    config['csvFileName']['value'] = 'bench'
+    config['ingestMode']['value'] = 'continuous'
+    config['timestampStyle']['value'] = style
+    config['timestampCol']['value'] = 'ts'
+    handle = csvplayback.plugin_init(config)
+    return handle, csvplayback.reader
+
+
+def convert_both(reader, chunk, style):
+    """ Converts a chunk the former way and with the columnar builder, from the same playback state. With
+    'current time' both conversions are made within a second, as their timestamps are taken from the clock.
+    """
+    start_c = reader.c
+    while True:
+        second = int(time.time())
+        old = legacy_chunk_to_readings(reader, chunk.copy())
+        reader.c, reader.ts_diff = start_c, None
+        new = list(reader.chunk_to_readings(chunk.copy()))
+        if style != 'current time' or int(time.time()) == second:
+            return old, new
+        reader.c, reader.ts_diff = start_c, None
+
+
+def run(rows, cols, repeat):
+    chunk = make_chunk(rows, cols)
+    with tempfile.TemporaryDirectory() as csv_dir:
+        chunk.head().to_csv(os.path.join(csv_dir, 'bench.csv'), index=False)
+        for style in ['current time', 'copy csv value', 'move csv value', 'use csv sample delta']:
+            handle, reader = make_reader(csv_dir, style)
+
+            old, new = convert_both(reader, chunk, style)
+
+            t0 = time.perf_counter()
+            for _ in range(repeat):
+                legacy_chunk_to_readings(reader, chunk.copy())
+            before = rows * repeat / (time.perf_counter() - t0)
+
+            t0 = time.perf_counter()
+            for _ in range(repeat):
+                for _ in reader.chunk_to_readings(chunk.copy()):
+                    pass
+            after = rows * repeat / (time.perf_counter() - t0)
+
+            csvplayback.plugin_shutdown(handle)
+            print("{:<22} before {:>12,.0f} rows/sec  after {:>12,.0f} rows/sec  x{:.1f}  same output: {}".format(
+                style, before, after, after / before, old == new))
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-r", "--rows", type=int, default=8000, help="Rows per chunk")
+    ap.add_argument("-c", "--cols", type=int, default=4, help="Number of numeric columns")
+    ap.add_argument("-n", "--repeat", type=int, default=20, help="Number of chunks to convert")
+    args = ap.parse_args()
+    run(args.rows, args.cols, args.repeat)
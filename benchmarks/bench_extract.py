@@ -0,0 +1,97 @@
+""" Throughput benchmark for the extraction of the readings of a raw csv file by process_csv_data.py
+
+Builds a synthetic Fledge readings export, rows like "{""channel1"":0.1,...,""channel8"":0.8}",user_ts, and
+measures the rows per second of:
+
+- the former string splitting, extended to every channel,
+- the column plan extractor (JSON decoder into typed columns),
+- the byte rewriting used for flat readings,
+- the whole conversion by get_clean_csv_file, with one worker and with one worker per CPU.
+
+Usage
+python3 benchmarks/bench_extract.py
+or
+python3 benchmarks/bench_extract.py --rows 1000000 --channels 8
+
+"""
+
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(_HERE, 'stubs'), os.path.join(_HERE, '..', 'python')]
+
+import numpy as np
+import pandas as pd
+
+from fledge.plugins.south.csvplayback import process_csv_data
+
+
+def legacy_extract(readings, keys):
+    """ The string splitting used before the column plan, one apply per channel, kept here as the baseline """
+    columns = {}
+    for i, key in enumerate(keys):
+        columns[key] = readings.apply(lambda x: x.split(",")[i].split(":")[1].split("}")[0])
+    return columns
+
+
+def make_file(path, rows, channels):
+    keys = ['channel{}'.format(i + 1) for i in range(channels)]
+    values = np.random.default_rng(0).random((rows, channels)).round(10).tolist()
+    start = pd.Timestamp('2024-01-01 00:00:00', tz='UTC')
+    stamps = (start + pd.to_timedelta(np.arange(rows) * 125, unit='us')).strftime('%Y-%m-%d %H:%M:%S.%f+00:00')
+    template = '"{{' + ','.join('""' + key + '"":{}' for key in keys) + '}}",{}\n'
+    with open(path, 'w') as fd:
+        fd.write('reading,user_ts\n')
+        fd.writelines(template.format(*row, stamp) for row, stamp in zip(values, stamps))
+    return keys
+
+
+def timed(rows, function, *args):
+    t0 = time.perf_counter()
+    result = function(*args)
+    return rows / (time.perf_counter() - t0), result
+
+
+def run(rows, channels):
+    with tempfile.TemporaryDirectory() as data_dir:
+        raw_path = os.path.join(data_dir, 'raw.csv')
+        keys = make_file(raw_path, rows, channels)
+        with open(raw_path, 'rb') as fd:
+            header = fd.readline()
+            data = fd.read()
+        readings = pd.read_csv(io.BytesIO(header + data), dtype=str)['reading']
+        plan = process_csv_data.infer_plan(raw_path)
+        print("{} rows, {:.0f} MB, column plan: {}".format(
+            rows, (len(header) + len(data)) / 1e6, ', '.join('{} {}'.format(name, kind) for name, (_, kind)
+                                                             in zip(plan.names, plan.columns))))
+
+        legacy_rate, legacy = timed(rows, legacy_extract, readings, keys)
+        plan_rate, extracted = timed(rows, plan.extract, readings)
+        bytes_rate, converted = timed(rows, process_csv_data.convert_rows, data, keys)
+        same = all(np.allclose(legacy[key].astype(float), extracted[key]) for key in keys) and \
+            converted is not None and \
+            np.allclose(pd.read_csv(io.BytesIO(converted), header=None).iloc[:, :channels].to_numpy(),
+                        np.column_stack([extracted[key] for key in keys]))
+        print("{:<28} {:>12,.0f} rows/sec".format('string splitting', legacy_rate))
+        print("{:<28} {:>12,.0f} rows/sec  x{:.1f}".format('column plan', plan_rate, plan_rate / legacy_rate))
+        print("{:<28} {:>12,.0f} rows/sec  x{:.1f}".format('byte rewriting', bytes_rate, bytes_rate / legacy_rate))
+        print("{:<28} {}".format('same values', same))
+
+        for workers in sorted({1, os.cpu_count() or 1}):
+            out_path = os.path.join(data_dir, 'out{}.csv'.format(workers))
+            rate, _ = timed(rows, process_csv_data.get_clean_csv_file, raw_path, out_path, 'ignore', 'linear',
+                            workers, 4 * 1024 * 1024)
+            print("{:<28} {:>12,.0f} rows/sec".format('whole file, {} worker(s)'.format(workers), rate))
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-r", "--rows", type=int, default=200000, help="Rows in the raw csv file")
+    ap.add_argument("-c", "--channels", type=int, default=8, help="Number of channels of the readings")
+    args = ap.parse_args()
+    run(args.rows, args.channels)
@@ -0,0 +1,225 @@
+""" End to end throughput benchmark for the csvplayback plugin, poll and async, outside of Fledge
+
+Generates a synthetic csv file of the given size, width, column types, timestamp style and compression, then
+plays it once through plugin_init/plugin_poll (poll mode) and plugin_start (async mode), with the stand-in
+Fledge modules of benchmarks/stubs. The async mode is the same module with POLL_MODE set to False, in a
+temporary copy of the python tree. Every run happens in a fresh interpreter and reports:
+
+- rows/sec, from plugin_init to the last row ingested,
+- time to first reading, from plugin_init to the first reading returned or ingested,
+- peak RSS of the interpreter.
+
+The readings are not paced: the plugin ingests as fast as it can convert. The results can be saved and
+compared with a previous run, the benchmark then fails if rows/sec drops by more than the tolerance.
+
+Usage
+python3 benchmarks/bench_playback.py
+or
+python3 benchmarks/bench_playback.py --rows 1000000 --cols 8 --dtypes float,int,str --timestamp_style \
+    "copy csv value" --compression gz --modes poll,async --ingest_modes continuous,burst --save before.json
+python3 benchmarks/bench_playback.py --baseline before.json --tolerance 0.1
+
+"""
+
+import argparse
+import json
+import os
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+_PYTHON = os.path.join(_HERE, '..', 'python')
+_MODULE = os.path.join('fledge', 'plugins', 'south', 'csvplayback', 'csvplayback.py')
+_STYLES = ['current time', 'copy csv value', 'move csv value', 'use csv sample delta']
+_SAMPLE_RATE = 10000  # rows per chunk in continuous mode, and per burst
+
+
+def make_file(csv_dir, rows, cols, dtypes, style, compression):
+    """ Writes the synthetic csv file, returns its path """
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(0)
+    data = {}
+    for i in range(cols):
+        dtype = dtypes[i % len(dtypes)]
+        name = 'channel{}'.format(i + 1)
+        if dtype == 'float':
+            data[name] = rng.random(rows).round(6)
+        elif dtype == 'int':
+            data[name] = rng.integers(-1000, 1000, rows)
+        elif dtype == 'str':
+            data[name] = np.char.add('id', rng.integers(0, 100, rows).astype(str))
+        else:
+            raise ValueError("Unknown column type {}".format(dtype))
+    if style != 'current time':
+        start = pd.Timestamp('2024-01-01 00:00:00', tz='UTC')
+        stamps = start + pd.to_timedelta(np.arange(rows) * (1e6 // _SAMPLE_RATE), unit='us')
+        data['ts'] = stamps.strftime('%Y-%m-%d %H:%M:%S.%f+00:00')
+    path = os.path.join(csv_dir, 'bench.csv' + ('.' + compression if compression != 'none' else ''))
+    pd.DataFrame(data).to_csv(path, index=False)
+    return path
+
+
+def async_tree(root):
+    """ Copies the python tree into root with the plugin switched to async mode """
+    shutil.copytree(_PYTHON, root, ignore=shutil.ignore_patterns('__pycache__'))
+    path = os.path.join(root, _MODULE)
+    with open(path) as fd:
+        source = fd.read()
+    with open(path, 'w') as fd:
+        fd.write(source.replace('\nPOLL_MODE=True', '\nPOLL_MODE=False', 1))
+
+
+def child(spec):
+    """ One run, printed as JSON """
+    sys.path[:0] = [os.path.join(_HERE, 'stubs'), spec['python']]
+    import async_ingest
+    from fledge.plugins.south.csvplayback import csvplayback
+
+    # readings are counted, not kept, so that the peak RSS is the plugin's
+    state = {'rows': 0, 'first': None}
+
+    def count(readings):
+        if readings and state['first'] is None:
+            state['first'] = time.perf_counter()
+        state['rows'] += sum(len(r['readings'][spec['first_column']]) if spec['array'] else 1 for r in readings)
+
+    async_ingest.ingest_callback = lambda callback, ingest_ref, readings: count(readings)
+
+    def unpaced(scheduler, event):
+        """ Every reading is due right away """
+        scheduler.owed()  # starts the schedule
+        return event.is_set()
+
+    csvplayback.PacingScheduler.wait = unpaced
+
+    info = csvplayback.plugin_info()
+    config = {k: {'value': v['default']} for k, v in info['config'].items()}
+    config['csvDirName']['value'] = spec['csv_dir']
+    config['csvFileName']['value'] = 'bench'
+    config['ingestMode']['value'] = spec['ingest_mode']
+    config['sampleRate']['value'] = str(_SAMPLE_RATE)
+    config['timestampStyle']['value'] = spec['timestamp_style']
+    config['timestampCol']['value'] = 'ts' if spec['timestamp_style'] != 'current time' else ''
+    config['postProcessMethod']['value'] = 'continue_playing'
+    config['metricsInterval']['value'] = '0'
+    for name, value in spec['config'].items():
+        if name not in config:
+            sys.exit("Unknown configuration item {}".format(name))
+        config[name]['value'] = value
+
+    t0 = time.perf_counter()
+    handle = csvplayback.plugin_init(config)
+    if csvplayback.POLL_MODE:
+        while state['rows'] < spec['rows']:
+            count(csvplayback.plugin_poll(handle) or [])
+    else:
+        csvplayback.plugin_register_ingest(handle, None, None)
+        csvplayback.plugin_start(handle)
+        while state['rows'] < spec['rows']:
+            time.sleep(0.002)
+    elapsed = time.perf_counter() - t0
+    csvplayback.plugin_shutdown(handle)
+
+    print(json.dumps({'rows/sec': spec['rows'] / elapsed, 'first reading (ms)': (state['first'] - t0) * 1000,
+                      'peak RSS (MB)': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))
+
+
+def run(args):
+    """ Plays the file in every mode, returns the median results per mode """
+    dtypes = args.dtypes.split(',')
+    config = dict(item.split('=', 1) for item in args.config)
+    results = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        csv_dir = os.path.join(work_dir, 'csv')
+        os.mkdir(csv_dir)
+        t0 = time.perf_counter()
+        path = make_file(csv_dir, args.rows, args.cols, dtypes, args.timestamp_style, args.compression)
+        print("{} rows x {} columns ({}), {}, {}: {:.1f} MB written in {:.1f} sec".format(
+            args.rows, args.cols, args.dtypes, args.timestamp_style, args.compression,
+            os.path.getsize(path) / 1e6, time.perf_counter() - t0))
+        trees = {'poll': os.path.abspath(_PYTHON)}
+        if 'async' in args.modes.split(','):
+            trees['async'] = os.path.join(work_dir, 'async')
+            async_tree(trees['async'])
+
+        for mode in args.modes.split(','):
+            for ingest_mode in args.ingest_modes.split(','):
+                spec = {'python': trees[mode], 'csv_dir': csv_dir, 'rows': args.rows, 'ingest_mode': ingest_mode,
+                        'timestamp_style': args.timestamp_style, 'config': config, 'first_column': 'channel1',
+                        'array': ingest_mode == 'burst' and config.get('arrayDatapoints') == 'true' or
+                        ingest_mode == 'continuous' and int(config.get('packWindow', '0')) > 0}
+                key = '{} {}'.format(mode, ingest_mode)
+                runs = []
+                for _ in range(args.runs):
+                    out = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', json.dumps(spec)],
+                                         capture_output=True, text=True)
+                    if out.returncode != 0:
+                        # e.g. a configuration the plugin rejects, like historic timestamps in burst mode
+                        print("{:<18} failed: {}".format(key, out.stderr.strip().splitlines()[0]))
+                        break
+                    runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+                if not runs:
+                    continue
+                results[key] = {name: statistics.median(r[name] for r in runs) for name in runs[0]}
+                print("{:<18} {:>12,.0f} rows/sec   first reading {:8.1f} ms   peak RSS {:7.1f} MB".format(
+                    key, *results[key].values()))
+    return results
+
+
+def shape(args):
+    """ What the results depend on besides the code """
+    return {name: getattr(args, name) for name in ['rows', 'cols', 'dtypes', 'timestamp_style', 'compression',
+                                                   'config']}
+
+
+def compare(results, baseline, tolerance):
+    """ Prints the change of rows/sec against the baseline, returns False if one dropped beyond tolerance """
+    passed = True
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        ratio = result['rows/sec'] / baseline[key]['rows/sec']
+        regressed = ratio < 1 - tolerance
+        passed = passed and not regressed
+        print("{:<18} x{:.2f} rows/sec vs baseline{}".format(key, ratio, '  REGRESSION' if regressed else ''))
+    return passed
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-r", "--rows", type=int, default=200000, help="Rows in the csv file")
+    ap.add_argument("-c", "--cols", type=int, default=4, help="Number of columns, besides the timestamp")
+    ap.add_argument("-d", "--dtypes", default='float', help="Column types, cycled over the columns: float,int,str")
+    ap.add_argument("-t", "--timestamp_style", default='current time', choices=_STYLES, help="timestampStyle")
+    ap.add_argument("-z", "--compression", default='none', choices=['none', 'gz', 'bz2'], help="File compression")
+    ap.add_argument("-m", "--modes", default='poll,async', help="Plugin modes: poll,async")
+    ap.add_argument("-i", "--ingest_modes", default='continuous,burst', help="Ingest modes: continuous,burst")
+    ap.add_argument("-n", "--runs", type=int, default=3, help="Runs per mode, the median is reported")
+    ap.add_argument("-o", "--config", action='append', default=[], metavar='NAME=VALUE',
+                    help="Configuration item of the plugin, may be repeated")
+    ap.add_argument("--save", help="Save the results as JSON into this file")
+    ap.add_argument("--baseline", help="Compare with the results saved by a previous run")
+    ap.add_argument("--tolerance", type=float, default=0.1, help="Drop of rows/sec failing the comparison")
+    ap.add_argument("--child", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.child:
+        child(json.loads(args.child))
+        sys.exit(0)
+    results = run(args)
+    if args.save:
+        with open(args.save, 'w') as fd:
+            json.dump({'shape': shape(args), 'results': results}, fd, indent=2)
+    if args.baseline:
+        with open(args.baseline) as fd:
+            baseline = json.load(fd)
+        if baseline['shape'] != shape(args):
+            print("The baseline was measured on another file: {}".format(baseline['shape']))
+        if not compare(results, baseline['results'], args.tolerance):
+            sys.exit(1)
@@ -0,0 +1,91 @@
+""" Startup latency benchmark for the csvplayback plugin (poll mode)
+
+Every run happens in a fresh interpreter, so that the cost of imports is part of the measure. Reports the time
+to import the plugin module, plugin_info, plugin_init and the time from plugin_init to the first reading
+returned by plugin_poll.
+
+Usage
+python3 benchmarks/bench_startup.py
+or
+python3 benchmarks/bench_startup.py --rows 100000 --runs 5 --ingest_mode burst
+
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def child(csv_dir, ingest_mode):
+    """ One measure, printed as JSON """
+    sys.path[:0] = [os.path.join(_HERE, 'stubs'), os.path.join(_HERE, '..', 'python')]
+
+    t0 = time.perf_counter()
+    from fledge.plugins.south.csvplayback import csvplayback
+    t_import = time.perf_counter() - t0
+    pandas_imported = 'pandas' in sys.modules
+
+    t0 = time.perf_counter()
+    info = csvplayback.plugin_info()
+    t_info = time.perf_counter() - t0
+
+    config = {k: {'value': v['default']} for k, v in info['config'].items()}
+    config['csvDirName']['value'] = csv_dir
+    config['csvFileName']['value'] = 'startup'
+    config['ingestMode']['value'] = ingest_mode
+
+    t0 = time.perf_counter()
+    handle = csvplayback.plugin_init(config)
+    t_init = time.perf_counter() - t0
+    readings = None
+    while not readings:
+        readings = csvplayback.plugin_poll(handle)
+    t_first = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    csvplayback.plugin_shutdown(handle)
+    t_shutdown = time.perf_counter() - t0
+
+    print(json.dumps({'import': t_import, 'pandas imported by import': pandas_imported, 'plugin_info': t_info,
+                      'plugin_init': t_init, 'init to first reading': t_first, 'plugin_shutdown': t_shutdown}))
+
+
+def run(rows, runs, ingest_mode):
+    with tempfile.TemporaryDirectory() as csv_dir:
+        with open(os.path.join(csv_dir, 'startup.csv'), 'w') as fd:
+            fd.write('channel1,channel2\n')
+            fd.writelines('{},{}\n'.format(i * 0.001, i * 0.002) for i in range(rows))
+
+        results = []
+        for _ in range(runs):
+            out = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', csv_dir,
+                                  '--ingest_mode', ingest_mode], check=True, capture_output=True, text=True)
+            results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    for key in results[0]:
+        values = [r[key] for r in results]
+        if isinstance(values[0], bool):
+            print("{:<28} {}".format(key, values[0]))
+        else:
+            print("{:<28} median {:8.1f} ms   max {:8.1f} ms".format(
+                key, statistics.median(values) * 1000, max(values) * 1000))
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-r", "--rows", type=int, default=10000, help="Rows in the csv file")
+    ap.add_argument("-n", "--runs", type=int, default=5, help="Number of runs")
+    ap.add_argument("-m", "--ingest_mode", default='continuous', help="burst or continuous")
+    ap.add_argument("--child", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.child:
+        child(args.child, args.ingest_mode)
+    else:
+        run(args.rows, args.runs, args.ingest_mode)
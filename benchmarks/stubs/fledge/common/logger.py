@@ -0,0 +1,9 @@
+""" Stand-in for fledge.common.logger """
+
+import logging
+
+
+def setup(logger_name=None, destination=None, level=logging.WARNING, propagate=False):
+    logger = logging.getLogger(logger_name)
+    logger.setLevel(level)
+    return logger
@@ -0,0 +1,11 @@
+""" Stand-in for fledge.plugins.common.utils """
+
+import datetime
+
+
+def local_timestamp():
+    """
+    :return: str - current time stamp with microseconds and machine timezone info
+    :example '2018-05-08 14:06:40.517313+05:30'
+    """
+    return str(datetime.datetime.now(datetime.timezone.utc).astimezone())
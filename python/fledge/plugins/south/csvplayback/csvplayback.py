@@ -6,17 +6,33 @@
 
 """ Module for CSV playback poll plugin using pandas """
 
+import bz2
+import collections
 import copy
+import ctypes
+import ctypes.util
+import importlib
+import importlib.util
+import io
+import json
 import logging
+import mmap
 import os
-from threading import Event
-from threading import Thread, Condition
+import re
+import select
+import struct
+import sys
+import tempfile
+from threading import Event, Lock
+from threading import Thread, current_thread, get_ident
+import bisect
+import heapq
+from concurrent.futures import ThreadPoolExecutor
 import datetime
 import time
-import glob
-
-import pandas as pd
-import numpy as np
+import itertools
+import queue
+import zlib
 
 import async_ingest
 from fledge.common import logger
@@ -29,26 +45,45 @@ __version__ = "${VERSION}"
 
 # SETTINGS
 POLL_MODE=True  # -> poll(t) or async(f)
-TIME_IT = True  # async timing information
 
 # GLOBAL VARIABLES DECLARATION
 _FLEDGE_ROOT = os.getenv("FLEDGE_ROOT", default='/usr/local/fledge')
 _FLEDGE_DATA = os.path.expanduser(_FLEDGE_ROOT + '/data')
 _FLEDGE_DATA_PREFIX = "FLEDGE_DATA"
+_SIDECAR_SUFFIX = '.npcols'  # binary columnar sidecar of a csv file, written by process_csv_data.py
+_SIDECAR_SCHEMA_SUFFIX = '.npcols.json'
+_SIDECAR_VERSION = 1
+_INDEX_SUFFIX = '.rowidx'  # sparse row index of a csv file, see RowIndex
+# date and optional time of day embedded in a file name, like vibe-2019-12-12.csv or log_20191212T103000.csv
+_EMBEDDED_TIMESTAMP = re.compile(r'(\d{4})-?(\d{2})-?(\d{2})(?:[T_ -]?(\d{2})[:-]?(\d{2})(?:[:-]?(\d{2}))?)?')
 
 _LOGGER = logger.setup(__name__, level=logging.DEBUG)
 
 plugin_mode = {True: 'poll', False: 'async'}[POLL_MODE]
 producer = None  # A Producer object to read data from csv file
 consumer = None  # A Consumer object to ingest data to database
-condition = None  # A conditional variable for mutual exclusivity among consumer and producer
 wait_event = Event()  # A variable to control the rate of ingest into database and indicate shutdown
 c_callback = None
 c_ingest_ref = None
-_sentinel = object()  # Indicates the file has been read
-readingsQueue = None  # Queue/ buffer to store readings.
+_sentinel = object()  # Put on the readings queue when the producer stops
+readingsQueue = None  # Bounded queue of prepared readings between producer and consumer.
 
 reader = None  # object holding state of current csv dataframe
+source_set = None  # SourceSet playing the configured sources, in place of the reader
+metrics = None  # PlaybackMetrics of the reader or of all the sources
+
+pd = None  # pandas and numpy are imported on first use, see _import_pandas()
+np = None
+
+SHUTDOWN_TIMEOUT = 10  # seconds to wait for each thread of the plugin to finish on shutdown
+
+# configuration items which a source of the 'sources' item can not override
+_SHARED_ITEMS = ('plugin', 'ingestMode', 'burstInterval', 'queueDepth', 'microBatchSize', 'maxCatchUp', 'sources',
+                 'sourcesJoin', 'joinTolerance', 'packWindow', 'metricsInterval', 'statsAsset', 'profiling',
+                 'profileInterval', 'profileDumps', 'checkpointInterval',
+                 'decompressThreads')
+# configuration items which plugin_reconfigure applies without restarting the playback
+_PROFILING_ITEMS = ('profiling', 'profileInterval', 'profileDumps')
 
 _DEFAULT_CONFIG = {
     'plugin': {
@@ -207,7 +242,7 @@ _DEFAULT_CONFIG = {
     'ignoreNaN': {
         'description': 'Ignore the NaN values or report error. NaN values occur due to whitespaces'
                        ' and missing values in CSV file. Default action is ignore. If report is selected'
-                       'and error is found delete the south service and try again with a clean CSV file.',
+                       ' the missing values of every column are counted and reported when the file is played.',
         'type': 'enumeration',
         'default': 'ignore',
         'options': ['ignore', 'report'],
@@ -232,10 +267,236 @@ _DEFAULT_CONFIG = {
         'validity': "postProcessMethod == \"rename\"",
         'order': '20'
     },
+    'queueDepth': {
+        'description': 'Number of chunks of readings prepared ahead of ingest in async mode.',
+        'type': 'integer',
+        'default': '3',
+        'minimum': '1',
+        'displayName': 'Async queue depth',
+        'order': '21'
+    },
+    'microBatchSize': {
+        'description': 'No. of readings ingested together in "continuous" mode. Every batch is ingested when '
+                       'its first reading is due as per the sample rate.',
+        'type': 'integer',
+        'default': '100',
+        'minimum': '1',
+        'displayName': 'Micro-batch size',
+        'validity': "ingestMode == \"continuous\"",
+        'order': '22'
+    },
+    'maxCatchUp': {
+        'description': 'Maximum time in milliseconds by which playback catches up after a stall. Readings which '
+                       'are late by more than this are played at the normal rate, shifting the schedule.',
+        'type': 'integer',
+        'default': '1000',
+        'minimum': '0',
+        'displayName': 'Maximum catch-up (ms)',
+        'order': '23'
+    },
+    'replayCacheMemory': {
+        'description': 'Memory in MB for keeping the parsed rows of a file which is played again, so that replays '
+                       'do not parse the csv file. Rows of bigger files are kept in a binary file in the data '
+                       'directory. 0 disables the replay cache.',
+        'type': 'integer',
+        'default': '100',
+        'minimum': '0',
+        'displayName': 'Replay cache memory (MB)',
+        'validity': "postProcessMethod == \"continue_playing\" && variableCols == \"false\"",
+        'order': '24'
+    },
+    'fileOrder': {
+        'description': 'Order in which the files matching the file name are played when they are deleted or '
+                       'renamed after playing: by name, by modification time or by the date and time in the '
+                       'file name (for example vibe-2019-12-12T10-30.csv).',
+        'type': 'enumeration',
+        'options': ['name', 'modification time', 'embedded timestamp'],
+        'default': 'name',
+        'displayName': 'File order',
+        'validity': "postProcessMethod != \"continue_playing\"",
+        'order': '25'
+    },
+    'sources': {
+        'description': 'Several csv sources to play at once, merged in timestamp order. Every source is an object '
+                       'overriding items of this configuration, at least assetName and csvFileName. '
+                       'ingestMode, burstInterval and the pacing items are shared by all sources.',
+        'type': 'JSON',
+        'default': json.dumps({'sources': []}),
+        'displayName': 'Sources',
+        'order': '26'
+    },
+    'sourcesJoin': {
+        'description': 'How the readings of the sources are merged. "interleave" plays the readings of every source '
+                       'in timestamp order. "as-of" fuses them into one reading per row of the first source, with '
+                       'the latest values of every other source at the time of the row.',
+        'type': 'enumeration',
+        'options': ['interleave', 'as-of'],
+        'default': 'interleave',
+        'displayName': 'Sources merge',
+        'order': '27'
+    },
+    'joinTolerance': {
+        'description': 'Maximum age in milliseconds of the values of the other sources joined to a row of the first '
+                       'source. Older values are left out. 0 for no limit.',
+        'type': 'integer',
+        'default': '0',
+        'minimum': '0',
+        'displayName': 'As-of join tolerance (ms)',
+        'validity': "sourcesJoin == \"as-of\"",
+        'order': '28'
+    },
+    'deltaMode': {
+        'description': 'Deltas used by the "use csv sample delta" timestamp style. "fixed" spaces all readings by '
+                       'the delta between the first two rows. "from file" keeps the delta between every two rows, '
+                       'so that the jitter and the gaps of the capture are played as they are.',
+        'type': 'enumeration',
+        'options': ['fixed', 'from file'],
+        'default': 'fixed',
+        'displayName': 'Delta mode',
+        'validity': "timestampStyle == \"use csv sample delta\"",
+        'order': '29'
+    },
+    'fillNaN': {
+        'description': 'Fill the missing values of the numeric columns while the file is played. "linear" and '
+                       '"nearest" interpolate between the values before and after, across chunks. "rolling mean" '
+                       'and "rolling median" use the values of the last rows. A gap longer than chunkSize rows is '
+                       'filled with the last value instead.',
+        'type': 'enumeration',
+        'options': ['none', 'linear', 'nearest', 'rolling mean', 'rolling median'],
+        'default': 'none',
+        'displayName': 'Fill NaN',
+        'validity': "variableCols == \"false\"",
+        'order': '30'
+    },
+    'fillWindow': {
+        'description': 'Number of rows, the row filled included, used by the rolling fills.',
+        'type': 'integer',
+        'default': '2',
+        'minimum': '1',
+        'displayName': 'Fill window',
+        'validity': "fillNaN == \"rolling mean\" || fillNaN == \"rolling median\"",
+        'order': '31'
+    },
+    'arrayDatapoints': {
+        'description': 'Pack every burst into one reading, with one array datapoint per numeric column holding the '
+                       'values of all the rows of the burst. Not used with sources.',
+        'type': 'boolean',
+        'default': 'false',
+        'displayName': 'Array datapoints',
+        'validity': "ingestMode == \"burst\"",
+        'order': '32'
+    },
+    'packWindow': {
+        'description': 'Number of consecutive rows packed into one reading, 0 for one reading per row. Every '
+                       'numeric column becomes an array datapoint, along with the startTimestamp and sampleInterval '
+                       '(seconds) datapoints. Not used with sources.',
+        'type': 'integer',
+        'default': '0',
+        'minimum': '0',
+        'displayName': 'Pack window',
+        'validity': "ingestMode == \"continuous\"",
+        'order': '33'
+    },
+    'metricsInterval': {
+        'description': 'Seconds between two reports of the playback metrics: rows parsed and readings emitted per '
+                       'second, parse, conversion and ingest times, queue depth, pacing lag and file switch gaps. '
+                       '0 for no report.',
+        'type': 'integer',
+        'default': '60',
+        'minimum': '0',
+        'displayName': 'Metrics interval',
+        'order': '34'
+    },
+    'statsAsset': {
+        'description': 'Asset the playback metrics are ingested as along with the data, every metrics interval. '
+                       'Empty for logging the metrics only.',
+        'type': 'string',
+        'default': '',
+        'displayName': 'Stats asset',
+        'validity': "metricsInterval != \"0\"",
+        'order': '35'
+    },
+    'profiling': {
+        'description': 'Profiles the parsing, conversion and ingest of the readings into FLEDGE_DATA/csvplayback/'
+                       'profiles: sampling of the stacks every 10 ms, or cProfile which is exact but slower. Can be '
+                       'switched on and off without restarting the playback.',
+        'type': 'enumeration',
+        'default': 'off',
+        'options': ['off', 'sampling', 'cProfile'],
+        'displayName': 'Profiling',
+        'order': '36'
+    },
+    'profileInterval': {
+        'description': 'Seconds covered by one profile dump',
+        'type': 'integer',
+        'default': '60',
+        'minimum': '1',
+        'displayName': 'Profile interval',
+        'validity': "profiling != \"off\"",
+        'order': '37'
+    },
+    'profileDumps': {
+        'description': 'Number of profile dumps kept, the oldest ones are deleted',
+        'type': 'integer',
+        'default': '10',
+        'minimum': '1',
+        'displayName': 'Profile dumps',
+        'validity': "profiling != \"off\"",
+        'order': '38'
+    },
+    'checkpointInterval': {
+        'description': 'Seconds between two saves of the playback position, so that the playback resumes where it '
+                       'was after a restart or a reconfiguration. 0 to play the files from the start. Not used '
+                       'with sources.',
+        'type': 'integer',
+        'default': '0',
+        'minimum': '0',
+        'displayName': 'Checkpoint interval',
+        'order': '39'
+    },
+    'windowStart': {
+        'description': 'Where to start playing every file: a row number, 0 being the first row of values, or a '
+                       'time of the timestamp column, UTC unless it has an offset. Empty to play from the start.',
+        'type': 'string',
+        'default': '',
+        'displayName': 'Window start (row or time)',
+        'order': '40'
+    },
+    'windowEnd': {
+        'description': 'Where to stop playing every file, this row or time excluded: a row number or a time of the '
+                       'timestamp column, UTC unless it has an offset. Empty to play to the end.',
+        'type': 'string',
+        'default': '',
+        'displayName': 'Window end (row or time)',
+        'order': '41'
+    },
+    'decompressThreads': {
+        'description': 'Threads decompressing the .gz and .bz2 files (.zst and .lz4 as well if zstandard and lz4 '
+                       'are installed) ahead of parsing. Files made of several members, like the ones of bgzip or '
+                       'pbzip2, are decompressed in parallel. -1 for one thread per CPU. 0 to turn this off: pandas '
+                       'then decompresses in series with parsing, but for .lz4 files which get one thread.',
+        'type': 'integer',
+        'default': '-1',
+        'minimum': '-1',
+        'displayName': 'Decompression threads',
+        'order': '42'
+    },
 
 }
 
 
+def _import_pandas():
+    """ Imports pandas and numpy. Deferred until a csv file is played, so that loading the plugin, plugin_info and
+    plugin_init do not pay for it.
+    """
+    global pd, np
+    if pd is None:
+        import numpy
+        import pandas
+        np = numpy
+        pd = pandas
+
+
 def plugin_info():
     """ Returns information about the plugin.
     Args:
@@ -270,56 +531,51 @@ def plugin_init(config):
     handle['mode'] = {'value': plugin_mode}
 
     try:
-        errors = False
-
-        if int(handle['sampleRate']['value']) < 1 or int(handle['sampleRate']['value']) > 1000000:
-            _LOGGER.error("sampleRate should be in range 1-1000000")
-            errors = True
+        errors = _validate(handle)
         if int(handle['burstInterval']['value']) < 1:
             _LOGGER.error("burstInterval should not be less than 1")
             errors = True
-        if handle['ingestMode']['value'] not in ['burst', 'continuous']:
-            _LOGGER.error("ingestMode should be one of ('burst', 'continuous')")
+        if int(handle['queueDepth']['value']) < 1:
+            _LOGGER.error("queueDepth should not be less than 1")
+            errors = True
+        if int(handle['microBatchSize']['value']) < 1:
+            _LOGGER.error("microBatchSize should not be less than 1")
             errors = True
-        if handle['timestampStyle']['value'] in ['copy csv value', 'move csv value', 'use csv sample delta'] and \
-                (handle['timestampCol']['value'] == '' or handle['timestampFormat']['value'] == ''):
-            _LOGGER.error("timestamp Column (of csv File) and timestamp Format must be specified ")
+        if int(handle['maxCatchUp']['value']) < 0:
+            _LOGGER.error("maxCatchUp should not be less than 0")
             errors = True
-        if (handle['timestampStyle']['value'] != 'current time') and (handle['ingestMode']['value'] == 'burst'):
-            _LOGGER.error("Historic and delta timestamps are only used in ""continuous"" mode")
+        if int(handle['joinTolerance']['value']) < 0:
+            _LOGGER.error("joinTolerance should not be less than 0")
+            errors = True
+        if int(handle['checkpointInterval']['value']) < 0:
+            _LOGGER.error("checkpointInterval should not be less than 0")
+            errors = True
+        if _validate_profiling(handle):
+            errors = True
+        if handle['ingestMode']['value'] not in ['burst', 'continuous']:
+            _LOGGER.error("ingestMode should be one of ('burst', 'continuous')")
             errors = True
         if errors:
             raise RuntimeError("{} plugin_init failed".format(__name__))
+        _set_chunk_size(handle)
 
-        # calculate period, burst size, and chunk size
-        try:
-            if handle['ingestMode']['value'] == 'burst':
-                burst_interval = int(handle['burstInterval']['value'])
-                # chunk up a "burst's" worth of samples
-                period = round(burst_interval / 1000.0, len(str(burst_interval)) + 1)
-                if handle['variableCols']['value'] == 'false':
-                    recs = int(period * int(handle['sampleRate']['value']))
-                else:
-                    recs = 1
-            else:
-                # chunk up a second's worth of samples
-                if handle['variableCols']['value'] == 'false':
-                    recs = int(handle['sampleRate']['value'])
-                else:
-                    recs = 1
-
-                period = round(1.0 / recs, len(str(recs)) + 1)
-                _LOGGER.info("recs is {} and period is {}".format(recs, period))
-        except ZeroDivisionError:
-            _LOGGER.warning('sampleRate must be greater than 0, defaulting to 1')
-            period = 1.0
-
-        handle['period'] = {'value': period}
-        handle['chunkSize'] = {'value': recs}
+        source_handles = _source_handles(handle)
+        for source in source_handles:
+            if _validate(source):
+                raise RuntimeError("{} plugin_init failed for source {}".format(__name__, source['assetName']['value']))
+            _set_chunk_size(source)
 
         # initialize the object that maintains csv state
-        global reader
-        reader = CSVReader(handle)
+        global reader, source_set, wait_event, metrics
+        wait_event.clear()
+        metrics = PlaybackMetrics.from_handle(handle)
+        if source_handles:
+            reader = None
+            source_set = SourceSet(handle, source_handles, metrics)
+        else:
+            source_set = None
+            reader = CSVReader(handle, metrics)
+        _switch_profiler(handle)
 
     except KeyError:
         raise
@@ -333,6 +589,138 @@ def plugin_init(config):
         return handle
 
 
+def _validate(handle):
+    """ Checks the items of a configuration which can be given for every source.
+    Returns:
+        True if there are errors, they are logged
+    """
+    errors = False
+    if int(handle['sampleRate']['value']) < 1 or int(handle['sampleRate']['value']) > 1000000:
+        _LOGGER.error("sampleRate should be in range 1-1000000")
+        errors = True
+    if handle['timestampStyle']['value'] in ['copy csv value', 'move csv value', 'use csv sample delta'] and \
+            (handle['timestampCol']['value'] == '' or handle['timestampFormat']['value'] == ''):
+        _LOGGER.error("timestamp Column (of csv File) and timestamp Format must be specified ")
+        errors = True
+    if (handle['timestampStyle']['value'] != 'current time') and (handle['ingestMode']['value'] == 'burst'):
+        _LOGGER.error("Historic and delta timestamps are only used in ""continuous"" mode")
+        errors = True
+    if int(handle['fillWindow']['value']) < 1:
+        _LOGGER.error("fillWindow should be at least 1")
+        errors = True
+    bounds = []
+    for name in ['windowStart', 'windowEnd']:
+        try:
+            bounds.append(_window_bound(handle[name]['value']))
+        except ValueError:
+            _LOGGER.error("{} should be a row number or a time".format(name))
+            errors = True
+    if any(bound is not None and bound[0] == 'time' for bound in bounds) and \
+            (handle['timestampCol']['value'] == '' or handle['variableCols']['value'] == 'true'):
+        _LOGGER.error("A time window needs the timestamp column, and no variable columns")
+        errors = True
+    if len(bounds) == 2 and None not in bounds and bounds[0][0] == bounds[1][0] and bounds[0][1] >= bounds[1][1]:
+        _LOGGER.error("windowEnd should be after windowStart")
+        errors = True
+    return errors
+
+
+def _window_bound(value):
+    """ Parses a bound of the playback window.
+    Args:
+        value: A row number, a time, or ''
+    Returns:
+        ('row', row number), ('time', nanoseconds since the epoch UTC), or None for no bound
+    """
+    value = value.strip()
+    if value == '':
+        return None
+    if value.isdigit():
+        return 'row', int(value)
+    _import_pandas()
+    stamp = pd.Timestamp(value)
+    if stamp is pd.NaT:
+        raise ValueError("No time in {}".format(value))
+    if stamp.tzinfo is None:
+        stamp = stamp.tz_localize('UTC')
+    return 'time', stamp.value
+
+
+def _set_chunk_size(handle):
+    """ Sets the period and the chunk size of a configuration """
+    # calculate period, burst size, and chunk size
+    try:
+        if handle['ingestMode']['value'] == 'burst':
+            burst_interval = int(handle['burstInterval']['value'])
+            # chunk up a "burst's" worth of samples
+            period = round(burst_interval / 1000.0, len(str(burst_interval)) + 1)
+            if handle['variableCols']['value'] == 'false':
+                recs = int(period * int(handle['sampleRate']['value']))
+            else:
+                recs = 1
+        else:
+            # chunk up a second's worth of samples
+            if handle['variableCols']['value'] == 'false':
+                recs = int(handle['sampleRate']['value'])
+            else:
+                recs = 1
+
+            period = round(1.0 / recs, len(str(recs)) + 1)
+            _LOGGER.info("recs is {} and period is {}".format(recs, period))
+    except ZeroDivisionError:
+        _LOGGER.warning('sampleRate must be greater than 0, defaulting to 1')
+        period = 1.0
+
+    handle['period'] = {'value': period}
+    handle['chunkSize'] = {'value': recs}
+
+
+def _source_handles(handle):
+    """ Builds a handle for every source of the 'sources' item: the plugin configuration, with the items given for
+    the source overridden.
+    Args:
+        handle: handle of the plugin
+    Returns:
+        list of handles, empty if no source is configured
+    """
+    value = handle.get('sources', {}).get('value') or '{}'
+    try:
+        sources = json.loads(value) if isinstance(value, str) else value
+        sources = sources.get('sources', [])
+    except (ValueError, AttributeError):
+        _LOGGER.error('sources should be a JSON document like {"sources": [{"assetName": ..., "csvFileName": ...}]}')
+        raise RuntimeError("{} plugin_init failed".format(__name__))
+
+    handles = []
+    for source in sources:
+        if not isinstance(source, dict) or 'assetName' not in source or 'csvFileName' not in source:
+            _LOGGER.error("Every source should be an object with at least assetName and csvFileName, not {}".format(
+                source))
+            raise RuntimeError("{} plugin_init failed".format(__name__))
+        for name in source:
+            if name not in _DEFAULT_CONFIG or name in _SHARED_ITEMS:
+                _LOGGER.error("{} can not be given for a source".format(name))
+                raise RuntimeError("{} plugin_init failed".format(__name__))
+        source_handle = copy.deepcopy(handle)
+        for name, item in source.items():
+            if isinstance(item, bool):
+                item = 'true' if item else 'false'
+            source_handle[name] = {'value': str(item)}
+        # readings of sources are merged one by one
+        source_handle['packWindow'] = {'value': '0'}
+        source_handle['arrayDatapoints'] = {'value': 'false'}
+        source_handle['checkpointInterval'] = {'value': '0'}
+        handles.append(source_handle)
+    if handles and int(handle['packWindow']['value']) > 0:
+        _LOGGER.warning("packWindow is not used with sources")
+    if handles and (handle['arrayDatapoints']['value'] == 'true' or
+                    any(str(source.get('arrayDatapoints')).lower() == 'true' for source in sources)):
+        _LOGGER.warning("arrayDatapoints is not used with sources")
+    if handles and int(handle['checkpointInterval']['value']) > 0:
+        _LOGGER.warning("checkpointInterval is not used with sources")
+    return handles
+
+
 def plugin_reconfigure(handle, new_config):
     """ Reconfigures the plugin
 
@@ -343,9 +731,15 @@ def plugin_reconfigure(handle, new_config):
         new_handle: new handle to be used in the future calls
     """
     _LOGGER.info("Old config for playback plugin {} \n new config {}".format(handle, new_config))
+    if _profiling_only(handle, new_config):
+        _LOGGER.info("Profiling switched to {} while playing".format(new_config['profiling']['value']))
+        new_handle = copy.deepcopy(handle)
+        for name in _PROFILING_ITEMS:
+            new_handle[name] = copy.deepcopy(new_config[name])
+        _switch_profiler(new_handle)
+        return new_handle
+    # returns once the threads of the plugin have finished
     plugin_shutdown(handle)
-    # Done to ensure proper shutdown of plugin
-    time.sleep(10)
     new_handle = plugin_init(new_config)
 
     if new_handle['mode']['value'] == 'async':
@@ -353,6 +747,36 @@ def plugin_reconfigure(handle, new_config):
     return new_handle
 
 
+def _validate_profiling(handle):
+    """ Checks the profiling items of a configuration.
+    Returns:
+        True if there are errors
+    """
+    errors = False
+    for name in ['profileInterval', 'profileDumps']:
+        if int(handle[name]['value']) < 1:
+            _LOGGER.error("{} should not be less than 1".format(name))
+            errors = True
+    return errors
+
+
+def _profiling_only(handle, new_config):
+    """ Whether the new configuration changes valid profiling items only, which are applied while playing """
+    global metrics
+    if metrics is None or _validate_profiling(new_config):
+        return False
+    return all(name in _PROFILING_ITEMS or name in handle and handle[name]['value'] == item['value']
+               for name, item in new_config.items())
+
+
+def _switch_profiler(handle):
+    """ Replaces the profiler of the playback by the one configured by handle """
+    global metrics
+    profiler, metrics.profiler = metrics.profiler, PlaybackProfiler.from_handle(handle)
+    if profiler is not None:
+        profiler.close()
+
+
 def plugin_shutdown(handle):
     """ Shutdowns the plugin doing required cleanup, to be called prior to the South plugin service being shut down.
 
@@ -362,28 +786,48 @@ def plugin_shutdown(handle):
         plugin shutdown
     """
     _LOGGER.info('csv playback Plugin Shutting down')
-    global reader
-    reader.shutdown_plugin = True
+    global reader, source_set
+    readers = source_set.readers if source_set is not None else [reader]
+    for csv_reader in readers:
+        csv_reader.shutdown_plugin = True
     _LOGGER.debug("Shutdown flag of csv reader set true.")
+    global wait_event
+    # The wait event flag needs to be set to shut down the plugin. It wakes up the threads waiting on it.
+    wait_event.set()
     if handle['mode']['value'] == 'async':
-        global producer, consumer, wait_event, condition, readingsQueue, mode
-        # The wait event flag needs to be set to shut down the plugin
-        wait_event.set()
-        time.sleep(2)  # It is done to allow the consumer thread to figure out that wait_event flag has been set.
-
-        if producer is not None:
-            producer._tstate_lock = None
-            producer = None
-        if consumer is not None:
-            consumer._tstate_lock = None
-            consumer = None
-        if readingsQueue:
-            readingsQueue = []
-        condition = None
+        global producer, consumer, readingsQueue, mode
+        for thread in [producer, consumer]:
+            _join(thread)
+        producer = None
+        consumer = None
+        readingsQueue = None
+    if source_set is not None:
+        source_set.close()
+        source_set = None
+    for csv_reader in readers:
+        _join(csv_reader.finder_thread)
+        csv_reader.drop_prefetch()
+        csv_reader.close_stream()
+        csv_reader.close_replay_cache()
+        csv_reader.report_nan()
+        csv_reader.close_checkpoint()
+    global metrics
+    if metrics is not None and metrics.profiler is not None:
+        metrics.profiler.close()
+        metrics.profiler = None
 
     _LOGGER.info('csv playback Plugin Shut down.')
 
 
+def _join(thread):
+    """ Waits for a thread of the plugin to finish, unless it is the calling thread """
+    if thread is None or thread is current_thread() or not thread.is_alive():
+        return
+    thread.join(timeout=SHUTDOWN_TIMEOUT)
+    if thread.is_alive():
+        _LOGGER.warning("{} did not finish within {} seconds.".format(thread.name, SHUTDOWN_TIMEOUT))
+
+
 if not POLL_MODE:
     def plugin_register_ingest(handle, callback, ingest_ref):
         """Required plugin interface component to communicate to South C server async mode
@@ -406,10 +850,9 @@ if not POLL_MODE:
         Returns:
             a playback reading in a JSON document, as a Python dict
         """
-        global producer, consumer, condition, readingsQueue, wait_event, reader
-        readingsQueue = []
+        global producer, consumer, readingsQueue, wait_event, reader
+        readingsQueue = queue.Queue(maxsize=int(handle['queueDepth']['value']))
 
-        condition = Condition()
         producer = Producer(handle)
         consumer = Consumer(handle)
 
@@ -425,110 +868,335 @@ if POLL_MODE:
         Args:
             handle: handle returned by the plugin initialisation call
         """
-        global reader
+        global reader, source_set, metrics
+        readings = _poll_readings(handle)
+        if readings:
+            metrics.add(emitted=len(readings))
+        scheduler = source_set.scheduler if source_set is not None else reader.scheduler
+        stats = metrics.report(scheduler)
+        if stats is not None:
+            readings = (readings or []) + [stats]
+        return readings
+
+    def _poll_readings(handle):
+        """ Returns the readings of a poll, None if there are none """
+        global reader, source_set, wait_event
+        if source_set is not None:
+            return source_set.poll(wait_event)
         if reader is None:
             raise ValueError
         if not reader.current_csv_file:
             _LOGGER.info("No file found to play inside the given directory.")
             return None
+        if reader.is_burst:
+            return _next_readings(handle)
+
+        # continuous - return the readings that are due as per the playback schedule, at least one micro-batch
+        scheduler = reader.scheduler
+        if scheduler.wait(wait_event):
+            return None
+        count = max(scheduler.owed(), scheduler.batch_size)
+        readings = []
+        while len(readings) < count:
+            reading = _next_readings(handle)
+            if reading is None:
+                break
+            readings.append(reading)
+            if reader.file_iter:
+                readings.extend(itertools.islice(reader.file_iter, count - len(readings)))
+        scheduler.done(len(readings))
+
+        # read and return subsequent asset formatted values from csv file
+        return readings if readings else None
+
+    def _next_readings(handle):
+        """ Returns the next reading (continuous mode) or burst of readings (burst mode) of the file being played.
+        Takes care of reaching the end of file.
+        Args:
+            handle: handle returned by the plugin initialisation call
+        """
+        global reader
+        if reader.file_iter:
+            readings = next(reader.file_iter, None)
         else:
+            _LOGGER.info("The csv file finally found. Playing readings from it.")
+            reader.read_csv_file()
+            readings = next(reader.file_iter, None) if reader.file_iter else None
+
+        if not readings:
+            _LOGGER.info('End of file reached.')
+            reader.post_process_file()
+
+            # load the file once again.
+            reader.read_csv_file()
+            # fetch readings from it.
             if reader.file_iter:
                 readings = next(reader.file_iter, None)
             else:
-                _LOGGER.info("The csv file finally found. Playing readings from it.")
-                reader.read_csv_file()
-                readings = next(reader.file_iter, None)
-
-            if not readings:
-                _LOGGER.info('End of file reached.')
-
-                if handle['postProcessMethod']['value'] == 'continue_playing':
-                    # reload csv file
-                    _LOGGER.info('Replaying it')
-                elif handle['postProcessMethod']['value'] == 'delete':
-                    _LOGGER.info('Deleting the csv file it')
-                    os.remove(reader.current_csv_file)
-                elif handle['postProcessMethod']['value'] == 'rename':
-                    _LOGGER.info('Renaming the csv file with suffix {}'.format(handle['suffixName']['value']))
-                    rename_name = reader.current_csv_file + handle['suffixName']['value']
-                    os.rename(reader.current_csv_file, rename_name)
-
-                if handle['postProcessMethod']['value'] != 'continue_playing':
-                    # Reset the current file.
-                    reader.current_csv_file = None
-                    reader.file_iter = None
-
-                    # start the finder thread once again.
-                    reader.start_finder_thread()
-
-                # load the file once again.
-                reader.read_csv_file()
-                # fetch readings from it.
-                if reader.file_iter:
-                    readings = next(reader.file_iter, None)
-                else:
-                    _LOGGER.info("The next file could not be loaded.")
-                    readings = None
+                _LOGGER.info("The next file could not be loaded.")
+                readings = None
 
-        # read and return subsequent asset formatted values from csv file
         return readings
 
 
+def _gzip_decompressor():
+    return zlib.decompressobj(wbits=31)
+
+
+def _zstd_decompressor():
+    return importlib.import_module('zstandard').ZstdDecompressor().decompressobj()
+
+
+def _lz4_decompressor():
+    return importlib.import_module('lz4.frame').LZ4FrameDecompressor()
+
+
+_PANDAS_CODECS = ('.gz', '.bz2', '.zst')  # compressions pandas reads on its own
+
+# compressed csv files by extension: pattern of the bytes beginning a member (gzip member, bz2 stream, zstd or lz4
+# frame), and the decompressor of a member. zstd and lz4 files are played if their packages are installed.
+_CODECS = {
+    '.gz': (re.compile(rb'\x1f\x8b\x08[\x00-\x1f]'), _gzip_decompressor),
+    '.bz2': (re.compile(rb'BZh[1-9]1AY&SY'), bz2.BZ2Decompressor),
+}
+if importlib.util.find_spec('zstandard') is not None:
+    _CODECS['.zst'] = (re.compile(rb'\x28\xb5\x2f\xfd'), _zstd_decompressor)
+if importlib.util.find_spec('lz4') is not None:
+    _CODECS['.lz4'] = (re.compile(rb'\x04\x22\x4d\x18'), _lz4_decompressor)
+
+
 class FileFinder(Thread):
+    SCAN_INTERVAL = 2  # seconds between two scans of the directory when it can not be watched
+    WATCH_TIMEOUT = 0.5  # seconds between two checks for shutdown while watching the directory
+    EXTENSIONS = ('.csv',) + tuple('csv' + extension for extension in _CODECS)
+
     def __init__(self, parent):
         """
-        Start the finder thread that looks out for csv files in directory.
+        Start the finder thread that looks out for csv files in directory and queues them for playing.
+        On Linux the directory is watched through inotify, elsewhere it is scanned periodically.
         Args:
             parent: The reader class object.
         """
-        super(FileFinder, self).__init__()
+        super(FileFinder, self).__init__(name='FileFinder')
         self.parent = parent
-
-    def run(self):
+        self.single = self.parent.handle['postProcessMethod']['value'] == 'continue_playing'
+        self.pattern = self.parent.handle['csvFileName']['value']
         if self.parent.handle['csvDirName']['value'].startswith(_FLEDGE_DATA_PREFIX):
             if len(self.parent.handle['csvDirName']['value'].split("/")) > 1:
-                csv_dir = self.parent.handle['csvDirName']['value'].replace(_FLEDGE_DATA_PREFIX, _FLEDGE_DATA)
+                self.csv_dir = self.parent.handle['csvDirName']['value'].replace(_FLEDGE_DATA_PREFIX, _FLEDGE_DATA)
             else:
-                csv_dir = _FLEDGE_DATA
+                self.csv_dir = _FLEDGE_DATA
         else:
-            csv_dir = self.parent.handle['csvDirName']['value']
+            self.csv_dir = self.parent.handle['csvDirName']['value']
 
-        _LOGGER.info("The directory to be searched is {}".format(csv_dir))
-        if not os.path.exists(csv_dir):
-            raise FileNotFoundError
+    def is_candidate(self, name):
+        """ Whether a file name matches the pattern of csv files to play """
+        return not name.startswith('.') and name.endswith(self.EXTENSIONS) and name.find(self.pattern) != -1
 
-        csv_file_name_pattern = self.parent.handle['csvFileName']['value']
-        full_file_list = csv_dir + '/' + '*'
-        found = False
-        while not found and not self.parent.shutdown_plugin:
-            time.sleep(2)
-            file_list = sorted(glob.glob(full_file_list))
-            if not file_list:
+    def scan(self):
+        """ Looks for the csv files to play in the directory once, in a single pass, and queues them.
+        Returns:
+            True if the reader has a file to play
+        """
+        found = []
+        empty = True
+        with os.scandir(self.csv_dir) as entries:
+            for entry in entries:
+                empty = False
+                if self.is_candidate(entry.name) and entry.is_file():
+                    found.append(entry.path)
+        if not found and self.parent.current_csv_file is None:
+            if empty:
                 _LOGGER.info("There are no files in this directory currently. Waiting for some time.")
-                continue
-            filtered_files = [f for f in file_list if os.path.split(f)[1].find(csv_file_name_pattern) != -1
-                              and os.path.split(f)[1].endswith(('.csv', 'csv.bz2', 'csv.gz'))]
-            if not filtered_files:
-                _LOGGER.info("There are no csv files in this directory currently. Waiting for some time.")
             else:
-                found = True
-                # Taking the file name as the first file found.
-                _LOGGER.info("File found will play the file {}".format(filtered_files[0]))
-                self.parent.current_csv_file = filtered_files[0]
+                _LOGGER.info("There are no csv files in this directory currently. Waiting for some time.")
+        return self.found(found)
+
+    def found(self, paths):
+        if paths:
+            self.parent.enqueue(paths)
+        return self.parent.current_csv_file is not None
+
+    def finished(self):
+        """ Whether the finder is done. A file which is played again is the only file to find, otherwise the
+        directory is watched for as long as the plugin runs, so that the next files are queued while playing.
+        """
+        global wait_event
+        if self.parent.shutdown_plugin or wait_event.is_set():
+            return True
+        return self.single and self.parent.current_csv_file is not None
+
+    def run(self):
+        global wait_event
+        _LOGGER.info("The directory to be searched is {}".format(self.csv_dir))
+        if not os.path.exists(self.csv_dir):
+            raise FileNotFoundError
+
+        try:
+            watcher = DirectoryWatcher(self.csv_dir)
+        except (OSError, AttributeError) as ex:
+            _LOGGER.info("Can not watch {} ({}), scanning it every {} seconds.".format(
+                self.csv_dir, ex, self.SCAN_INTERVAL))
+            watcher = None
+
+        try:
+            # A file may have arrived before the watch was set up
+            self.scan()
+            while not self.finished():
+                if watcher is None:
+                    wait_event.wait(self.SCAN_INTERVAL)
+                    self.scan()
+                    continue
+                names = watcher.read(self.WATCH_TIMEOUT)
+                if names is None:
+                    # events have been lost
+                    self.scan()
+                    continue
+                self.found([os.path.join(self.csv_dir, name) for name in names if self.is_candidate(name)])
+        finally:
+            if watcher is not None:
+                watcher.close()
+
+
+class DirectoryWatcher:
+    """ Watches a directory through Linux inotify for files which are completely written or moved into it """
+
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_Q_OVERFLOW = 0x00004000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    EVENT = struct.Struct('iIII')  # wd, mask, cookie, len of the name that follows
+
+    def __init__(self, path):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+        if libc.inotify_add_watch(self.fd, os.fsencode(path), self.IN_CLOSE_WRITE | self.IN_MOVED_TO) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, os.strerror(errno))
+
+    def read(self, timeout):
+        """ Waits for files up to timeout seconds.
+        Returns:
+            names of the files written or moved into the directory, None if events have been lost
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        names = []
+        offset = 0
+        while offset < len(data):
+            _, mask, _, length = self.EVENT.unpack_from(data, offset)
+            offset += self.EVENT.size
+            if mask & self.IN_Q_OVERFLOW:
+                return None
+            names.append(os.fsdecode(data[offset:offset + length].rstrip(b'\0')))
+            offset += length
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+
+class Playlist:
+    """ Queue of the csv files waiting to be played, kept in playing order """
+
+    def __init__(self, order):
+        """
+        Args:
+            order: 'name', 'modification time' or 'embedded timestamp'
+        """
+        self.order = order
+        self.entries = []  # sorted (key, path)
+        self.lock = Lock()
+
+    def key(self, path):
+        """ Sort key of a file as per the configured order, names break ties """
+        name = os.path.basename(path)
+        if self.order == 'modification time':
+            return os.stat(path).st_mtime_ns, name
+        if self.order == 'embedded timestamp':
+            match = _EMBEDDED_TIMESTAMP.search(name)
+            if match is None:
+                # files without a timestamp in their name are played last
+                return 1, '', name
+            return 0, ''.join(part or '00' for part in match.groups()), name
+        return name,
+
+    def add(self, paths, current=None):
+        """ Queues the files which are neither queued already nor the current file.
+        Returns:
+            No. of files queued
+        """
+        added = 0
+        with self.lock:
+            queued = {path for _, path in self.entries}
+            for path in paths:
+                if path == current or path in queued:
+                    continue
+                try:
+                    key = self.key(path)
+                except OSError:
+                    # gone already
+                    continue
+                bisect.insort(self.entries, (key, path))
+                queued.add(path)
+                added += 1
+        return added
+
+    def peek(self):
+        with self.lock:
+            return self.entries[0][1] if self.entries else None
+
+    def pop(self):
+        """ Returns the next file which still exists, None if there is none """
+        with self.lock:
+            while self.entries:
+                _, path = self.entries.pop(0)
+                if os.path.isfile(path):
+                    return path
+        return None
+
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
 
 
 class CSVReader:
-    def __init__(self, handle):
+    def __init__(self, handle, metrics=None):
         self.handle = handle
+        self.metrics = metrics if metrics is not None else PlaybackMetrics.from_handle(handle)
 
         self.is_burst = self.handle['ingestMode']['value'] == 'burst'
+        self.is_array_burst = self.is_burst and self.handle['arrayDatapoints']['value'] == 'true'
+        self.pack_window = 0 if self.is_burst else int(self.handle['packWindow']['value'])
+        self.unpacked_columns = set()  # columns left out of the array datapoints, as they are not numeric
         self.is_historic_ts = self.handle['timestampStyle']['value'] in ['copy csv value', 'move csv value']
         self.is_drop_ts = self.handle['timestampStyle']['value'] == 'move csv value'
         self.is_delta_ts = self.handle['timestampStyle']['value'] == 'use csv sample delta'
         self.asset_name = self.handle['assetName']['value']
         self.ts_col = self.handle['timestampCol']['value']
+        self.ts_parser = TimestampParser.for_format(self.handle['timestampFormat']['value'])
         self.c = datetime.datetime.now(datetime.timezone.utc).astimezone()
         self.ts_diff = None
+        self.is_delta_from_file = self.handle['deltaMode']['value'] == 'from file'
+        self.delta_anchor = None  # (playback time, file time) in ns of the last row played of the current file
+        self.delta_step = 0  # last delta in ns between two rows of the file
+        self.nan_counts = {}  # missing values per column in the file being played, when ignoreNaN is report
+        self.nan_rows = 0  # rows of the file validated so far
+        self.nan_total = 0  # missing values found since the plugin started
+        self.nan_reported = set()  # files whose missing values have been reported, replays are not reported again
+        self.nan_repair = None
+        if self.handle['fillNaN']['value'] != 'none' and self.handle['variableCols']['value'] == 'false':
+            self.nan_repair = NaNRepair(self.handle['fillNaN']['value'], int(self.handle['fillWindow']['value']),
+                                        max(int(self.handle['chunkSize']['value']), 1), skip=[self.ts_col])
         self.df = None
         self.file_iter = None
         self.process_variable_columns = False
@@ -536,23 +1204,148 @@ class CSVReader:
         self.meta_data_ingested = False
         self.meta_data = {}
         self.current_csv_file = None
+        self.file_event = Event()  # set when the file to play has been found
+        self.file_lock = Lock()  # guards the switch to the next file between the finder and the playing thread
+        self.playlist = Playlist(handle['fileOrder']['value'])  # files waiting to be played
+        self.prefetch = None  # Prefetch of the next file in the playlist
+        self.prefetch_lock = Lock()
         self.shutdown_plugin = False
         self.finder_thread = None
+        self.stream = None  # DecompressedStream of the current file if it is compressed
+        self.decompress_threads = int(self.handle['decompressThreads']['value'])
+        if self.decompress_threads < 0:
+            self.decompress_threads = os.cpu_count() or 1
+        self.replay_cache = None  # ReplayCache of the current file if it is played in a loop
+        self.scheduler = PacingScheduler.from_handle(handle)
+        self.checkpoint = Checkpoint.from_handle(handle)
+        self.resume = self.checkpoint.load() if self.checkpoint is not None else None  # position to resume at
+        self.file_identity = None  # size and modification time of the file being played
+        self.rows_played = 0  # rows of the file converted into readings, or skipped as out of the window
+        self.passes = 0  # no. of times a file has started playing, replays included
+        # playback window: first row and row after the last one, then the same in ns of the file times
+        self.window_rows = [0, None]
+        self.window_times = [None, None]
+        for i, name in enumerate(['windowStart', 'windowEnd']):
+            bound = _window_bound(self.handle[name]['value'])
+            if bound is not None:
+                (self.window_rows if bound[0] == 'row' else self.window_times)[i] = bound[1]
         self.start_finder_thread()
         self.read_csv_file()
 
     def start_finder_thread(self):
-        self.finder_thread = FileFinder(self)
+        if self.finder_thread is not None and self.finder_thread.is_alive():
+            return
+        finder = FileFinder(self)
+        # The first scan is done right away. The thread is needed only if there is no file to play yet, or to
+        # queue the files arriving while playing when the played files are deleted or renamed.
+        if os.path.isdir(finder.csv_dir) and finder.scan() and finder.single:
+            self.finder_thread = None
+            return
+        self.finder_thread = finder
         self.finder_thread.start()
 
-    def stop_finder_thread(self):
-        if self.finder_thread:
-            self.finder_thread.join()
-            self.finder_thread = None
+    def enqueue(self, paths):
+        """ Queues csv files for playing. The first of them is played right away if no file is being played.
+        Args:
+            paths: Full paths of the csv files found
+        Returns: None
+        """
+        with self.file_lock:
+            added = self.playlist.add(paths, self.current_csv_file)
+            if added:
+                _LOGGER.debug("{} file(s) queued, {} waiting to be played.".format(added, len(self.playlist)))
+            if self.current_csv_file is None:
+                self.current_csv_file = self.playlist.pop()
+                if self.current_csv_file is None:
+                    return
+                _LOGGER.info("File found will play the file {}".format(self.current_csv_file))
+                self.file_event.set()
+                return
+        if added and self.file_iter is not None:
+            self.start_prefetch()
+
+    def start_prefetch(self):
+        """ Opens the next file of the playlist and parses its first chunk in the background, so that it is
+        ready to play as soon as the current file ends.
+        Returns: None
+        """
+        if self.handle['postProcessMethod']['value'] == 'continue_playing' or self.shutdown_plugin:
+            return
+        csv_path = self.playlist.peek()
+        with self.prefetch_lock:
+            if csv_path is None or (self.prefetch is not None and self.prefetch.csv_path == csv_path):
+                return
+            stale, self.prefetch = self.prefetch, Prefetch(self, csv_path)
+            self.prefetch.start()
+        if stale is not None:
+            stale.discard()
+
+    def take_prefetch(self, csv_path):
+        """ Returns the source of the file read ahead if it is csv_path and has not changed since, else None """
+        with self.prefetch_lock:
+            prefetch, self.prefetch = self.prefetch, None
+        if prefetch is None:
+            return None
+        source = prefetch.result()
+        if source is not None and prefetch.csv_path == csv_path and _file_identity(csv_path) == prefetch.identity:
+            _LOGGER.debug("Playing {} read ahead.".format(csv_path))
+            return source
+        prefetch.discard()
+        return None
+
+    def drop_prefetch(self):
+        with self.prefetch_lock:
+            prefetch, self.prefetch = self.prefetch, None
+        if prefetch is not None:
+            prefetch.discard()
 
     def get_csv_file_name(self):
         return self.current_csv_file
 
+    def post_process_file(self):
+        """ Applies the post process method to the file which has been played completely.
+        Unless the file is played again, the next file of the playlist becomes the current file. The finder
+        thread is started to look out for the next file if there is none.
+        Returns: None
+        """
+        self.report_nan()
+        method = self.handle['postProcessMethod']['value']
+        if method == 'continue_playing':
+            # reload csv file
+            _LOGGER.info('Replaying it')
+        elif method == 'delete':
+            _LOGGER.info('Deleting the csv file it')
+            os.remove(self.current_csv_file)
+            for suffix in [_SIDECAR_SUFFIX, _SIDECAR_SCHEMA_SUFFIX, _INDEX_SUFFIX]:
+                if os.path.exists(self.current_csv_file + suffix):
+                    os.remove(self.current_csv_file + suffix)
+        elif method == 'rename':
+            _LOGGER.info('Renaming the csv file with suffix {}'.format(self.handle['suffixName']['value']))
+            rename_name = self.current_csv_file + self.handle['suffixName']['value']
+            os.rename(self.current_csv_file, rename_name)
+            # keep the sidecar next to its csv file
+            for suffix in [_SIDECAR_SUFFIX, _SIDECAR_SCHEMA_SUFFIX, _INDEX_SUFFIX]:
+                if os.path.exists(self.current_csv_file + suffix):
+                    os.rename(self.current_csv_file + suffix, rename_name + suffix)
+
+        if method != 'continue_playing':
+            # Reset the current file.
+            self.close_stream()
+            self.close_replay_cache()
+            self.df = None
+            self.file_iter = None
+            with self.file_lock:
+                self.current_csv_file = self.playlist.pop()
+                if self.current_csv_file is None:
+                    self.file_event.clear()
+            if self.current_csv_file is not None:
+                _LOGGER.info("Playing the next file {}".format(self.current_csv_file))
+            else:
+                self.metrics.idle(self)
+                self.drop_prefetch()
+                # start the finder thread once again.
+                self.start_finder_thread()
+
     def read_csv_file(self):
         """Creates iterators for retrieving chunks of lines from a csv file, and collections
         of asset messages from the chunks of lines.
@@ -563,12 +1356,213 @@ class CSVReader:
         _LOGGER.debug("The file to be played is {}".format(csv_path))
         if not csv_path:
             return None
+        # the deltas of the file start after the last reading played
+        self.delta_anchor = None
+        self.rows_played = 0
+        self.passes += 1
+        self.file_identity = _file_identity(csv_path)
+        resume, self.resume = self.resume, None
+        if resume is not None and (resume['file'], resume['size'], resume['mtime_ns']) != \
+                (csv_path, *(self.file_identity or (None, None))):
+            _LOGGER.info("The checkpoint of {} does not match {}, playing it from the start".format(
+                resume['file'], csv_path))
+            resume = None
+        _import_pandas()
         if os.path.isfile(csv_path) and os.path.getsize(csv_path) == 0:
             _LOGGER.error(f"CSV file {csv_path} has zero length")
             raise EOFError
+
+        if self.replay_cache is not None:
+            if self.replay_cache.replayable(csv_path):
+                _LOGGER.debug("Replaying {} from the replay cache.".format(csv_path))
+                chunks = self.windowed(self.repaired(self.replay_cache.replay()), 0, None)
+                self.df = self.metrics.chunks(chunks, self)
+                self.file_iter = self.file_to_readings()
+                return None
+            self.close_replay_cache()
+
+        source = self.take_prefetch(csv_path)
+        if source is None:
+            source = self.open_source(csv_path)
+        self.close_stream()
+        self.stream = source.stream
+        self.process_variable_columns = source.variable_columns
+        if source.meta_data is not None:
+            self.process_metadata = True
+            self.meta_data = source.meta_data
+            _LOGGER.debug("The meta data picked from csv file {}".format(self.meta_data))
+            self.meta_data_ingested = False
+
+        first_row, stop_row = self.window_range(csv_path, source)
+        if resume is not None:
+            _LOGGER.info("Resuming {} after {} rows".format(csv_path, resume['rows']))
+            self.restore(resume)
+            first_row = max(first_row, resume['rows'])
+        if first_row:
+            # a partly played file is not recorded for replays
+            chunks = self.seek(csv_path, source, first_row)
         else:
-            self.stop_finder_thread()
+            chunks = self.record_chunks(csv_path, source.iterator())
+        self.rows_played = first_row
+        self.df = self.metrics.chunks(self.windowed(self.repaired(chunks), first_row, stop_row), self)
+        self.file_iter = self.file_to_readings()
+        self.start_prefetch()
+
+    def header_lines(self):
+        """ No. of lines before the first row of values, None if rows are not lines (variable columns) """
+        if self.handle['variableCols']['value'] == 'true':
+            return None
+        lines = 0
+        if self.handle['headerMethod']['value'] in ['skip_rows', 'pass_in_datapoint']:
+            lines = int(self.handle['noOfRows']['value'])
+        if self.handle['columnMethod']['value'] == 'explicit':
+            return lines + 1
+        return lines + int(self.handle['rowIndexForColumnNames']['value']) + 1
+
+    def seek(self, csv_path, source, rows):
+        """ Returns the chunks of a file from a row on, where a checkpoint has left the playback or the window
+        starts. An uncompressed file read by pandas is read from the byte offset of the row, found through its
+        RowIndex. Other files are read from the start, the rows
+        before are discarded.
+        Args:
+            csv_path: The csv file
+            source: CSVSource of the file
+            rows: No. of rows before the row
+        Returns:
+            iterator over the chunks from the row on
+        """
+        _LOGGER.debug("Playing {} from row {}".format(csv_path, rows))
+        chunksize = int(self.handle['chunkSize']['value'])
+        index = self.row_index(csv_path, source)
+        if index is None or isinstance(source.chunks, ColumnarSidecar):
+            return _skip_rows(source.iterator(), rows)
+        offset = index.offset(rows)
+        if offset is None:
+            return iter([])
+        names = self.column_names(source)
+        if self.handle['columnMethod']['value'] == 'explicit':
+            _, dtype = self.explicit_columns()
+            return _read_from(csv_path, offset, chunksize, names=names, dtype=dtype,
+                              usecols=[n for n in names if n != ''])
+        if names is None:
+            return iter([])
+        return _read_from(csv_path, offset, chunksize, names=names)
+
+    def row_index(self, csv_path, source):
+        """ Returns the RowIndex of a file, None if its rows can not be found by their byte offset """
+        header_lines = self.header_lines()
+        if header_lines is None or not csv_path.endswith('.csv') or source.variable_columns:
+            return None
+        return RowIndex.load(csv_path, header_lines)
+
+    def column_names(self, source):
+        """ Returns the names of the columns of the file, one per column of the file, None for an empty file """
+        if self.handle['columnMethod']['value'] == 'explicit':
+            return self.explicit_columns()[0]
+        # the column names are the ones of the first chunk
+        if source.first is None:
+            source.read_ahead()
+        return None if source.first is None else list(source.first.columns)
+
+    def window_range(self, csv_path, source):
+        """ Returns the rows of a file between which the playback window lies, as far as they are known before
+        reading the rows: the window rows, narrowed by the times of the blocks of rows of the RowIndex.
+        Returns:
+            first row, row after the last one or None if unknown
+        """
+        first_row, stop_row = self.window_rows
+        if self.window_times == [None, None]:
+            return first_row, stop_row
+        index = self.row_index(csv_path, source)
+        names = self.column_names(source) if index is not None else None
+        if names is None or self.ts_col not in names:
+            return first_row, stop_row
+        if not index.index_times(names.index(self.ts_col), self.handle['timestampFormat']['value']):
+            return first_row, stop_row
+        time_first, time_stop = index.time_range(*self.window_times)
+        _LOGGER.debug("The time window of {} lies in rows {} to {}".format(csv_path, time_first, time_stop))
+        return max(first_row, time_first), time_stop if stop_row is None else min(stop_row, time_stop)
+
+    def windowed(self, chunks, row, stop_row):
+        """ Keeps the rows of the chunks in the playback window. The rows left out count as played.
+        Args:
+            chunks: iterator over the chunks of the file
+            row: Row of the file the chunks start at
+            stop_row: Row from which on no row is in the window, None if unknown
+        Returns:
+            iterator over the chunks to play
+        """
+        if (self.window_rows == [0, None] and self.window_times == [None, None]) or self.process_variable_columns:
+            return chunks
+        return self._windowed(chunks, row, stop_row)
+
+    def _windowed(self, chunks, row, stop_row):
+        start_row, end_row = self.window_rows
+        start_time, end_time = self.window_times
+        if end_row is not None:
+            stop_row = end_row if stop_row is None else min(stop_row, end_row)
+        if stop_row is not None and row >= stop_row:
+            return
+        for chunk in chunks:
+            n_rows = len(chunk)
+            window = chunk.iloc[max(start_row - row, 0):n_rows if stop_row is None else max(stop_row - row, 0)]
+            if self.window_times != [None, None] and len(window):
+                file_times = self.ts_parser.parse(window[self.ts_col]).utc_nanos()
+                keep = file_times != np.iinfo('int64').min
+                if start_time is not None:
+                    keep &= file_times >= start_time
+                if end_time is not None:
+                    keep &= file_times < end_time
+                if not keep.all():
+                    window = window[keep]
+            self.rows_played += n_rows - len(window)
+            row += n_rows
+            if len(window) == n_rows:
+                yield chunk
+            elif len(window):
+                yield window.reset_index(drop=True)
+            if stop_row is not None and row >= stop_row:
+                return
 
+    def position(self):
+        """ Playback position after the rows converted so far, as saved by a checkpoint """
+        size, mtime_ns = self.file_identity or (None, None)
+        return {
+            'file': self.current_csv_file,
+            'size': size,
+            'mtime_ns': mtime_ns,
+            'rows': self.rows_played,
+            'clock': pd.Timestamp(self.c).isoformat(),
+            'ts_diff': None if self.ts_diff is None else int(self.ts_diff.value),
+            'delta_anchor': None if self.delta_anchor is None else list(self.delta_anchor),
+            'delta_step': self.delta_step,
+        }
+
+    def restore(self, position):
+        """ Takes the row count and the timestamp clock back from a saved position """
+        self.rows_played = position['rows']
+        self.c = pd.Timestamp(position['clock'])
+        self.ts_diff = None if position['ts_diff'] is None else pd.Timedelta(position['ts_diff'], unit='ns')
+        self.delta_anchor = None if position['delta_anchor'] is None else tuple(position['delta_anchor'])
+        self.delta_step = position['delta_step']
+
+    def commit(self):
+        """ Records that the readings of the rows converted so far have been handed over """
+        if self.checkpoint is not None:
+            self.checkpoint.commit(self.position())
+
+    def close_checkpoint(self):
+        if self.checkpoint is not None:
+            self.checkpoint.save()
+
+    def open_source(self, csv_path):
+        """ Opens a csv file for playing, as configured. Leaves the state of the reader untouched, so that the
+        next file can be opened while the current one is being played.
+        Args:
+            csv_path: The csv file to play
+        Returns:
+            CSVSource of the file
+        """
         # we read a chunk whose size is based on whether we are returning
         # a second's worth of data if we are in "continuous" mode, otherwise a "burst's" worth of data
         chunksize = int(self.handle['chunkSize']['value'])
@@ -577,128 +1571,302 @@ class CSVReader:
         # Check the header processing method
 
         should_skip_row = False
+        variable_columns = False
         if self.handle['headerMethod']['value'] == 'skip_rows' or \
                 self.handle['headerMethod']['value'] == 'pass_in_datapoint':
             should_skip_row = True
             rows_to_skip = int(self.handle['noOfRows']['value'])
             _LOGGER.debug("We need to skip {} rows".format(rows_to_skip))
 
-        # check if variable columns are there
-        if self.handle['variableCols']['value'] == 'true':
-            _LOGGER.debug("We have variable no of columns per row")
-            if should_skip_row:
-                self.df = pd.read_csv(csv_path, iterator=True, chunksize=chunksize,
-                                      skiprows=rows_to_skip, header=None,
-                                      engine='python')
-            else:
-                self.df = pd.read_csv(csv_path, iterator=True, chunksize=chunksize,
-                                      header=None,
-                                      engine='python')
-            self.process_variable_columns = True
-        # Check the column processing method
-
-        else:
-            if self.handle['columnMethod']['value'] == 'explicit':
-                names = self.handle['useColumns']['value']
-                _LOGGER.debug("The column names explicitly given are {}".format(names))
-                has_type = ':' in names
-                names = [] if names == '' else names.split(',')
-                if has_type:
-                    typeMap = {
-                        'str': 'object',
-                        'int': 'int64',
-                        'float': 'float64',
-                        'bool': 'bool_',
-                        'timestamp': 'datetime64'
-                    }
-                    # column list can have a :type sepcifier
-                    org_names = names
-                    dtype = {}
-                    names = []
-                    for n in org_names:
-                        if n == '':
-                            names.append(n)
-                        else:
-                            nt = n.split(':')
-                            if len(nt) == 1:
-                                names.append(n)
-                            elif len(nt) == 2:
-                                if nt[1] not in ['str', 'int', 'float', 'timestamp', 'bool']:
-                                    _LOGGER.error("{} must be in [str, int, float, timestamp, bool]".format(nt[1]))
-                                    raise TypeError
-                                dtype[nt[0]] = typeMap[nt[1]]
-                                names.append(nt[0])
-                            else:
-                                _LOGGER.error("{} must be of the form <name>:<type>".format(nt))
-                                raise ValueError("{} must be of the form <name>:<type>".format(nt))
-                else:
-                    dtype = None
-
-                if should_skip_row:
-                    self.df = pd.read_csv(csv_path, iterator=True, chunksize=chunksize,
-                                          header=0,
-                                          names=names,
-                                          dtype=dtype,
-                                          usecols=[n for n in names if n != ''],
-                                          skiprows=rows_to_skip)
-                else:
-                    self.df = pd.read_csv(csv_path, iterator=True, chunksize=chunksize,
-                                          header=0,
-                                          names=names,
-                                          dtype=dtype,
-                                          usecols=[n for n in names if n != ''])
-
-            elif self.handle['columnMethod']['value'] == 'pick_from_file':
-                _LOGGER.debug("We are picking header names from some index in the file.")
-                column_row = int(self.handle['rowIndexForColumnNames']['value'])
+        # a compressed file is decompressed in the background, pandas parses it from the stream
+        stream = DecompressedStream.open(csv_path, self.decompress_threads)
+        csv_input = csv_path if stream is None else io.BufferedReader(stream, DecompressedStream.SEGMENT)
+        try:
+            # check if variable columns are there
+            if self.handle['variableCols']['value'] == 'true':
+                _LOGGER.debug("We have variable no of columns per row")
                 if should_skip_row:
-                    self.df = pd.read_csv(csv_path, iterator=True, chunksize=chunksize,
-                                          header=column_row, skiprows=rows_to_skip)
+                    chunks = pd.read_csv(csv_input, iterator=True, chunksize=chunksize,
+                                         skiprows=rows_to_skip, header=None,
+                                         engine='python')
                 else:
-                    self.df = pd.read_csv(csv_path, iterator=True, chunksize=chunksize,
-                                          header=column_row)
+                    chunks = pd.read_csv(csv_input, iterator=True, chunksize=chunksize,
+                                         header=None,
+                                         engine='python')
+                variable_columns = True
+            # Check the column processing method
 
+            else:
+                if self.handle['columnMethod']['value'] == 'explicit':
+                    names, dtype = self.explicit_columns()
+
+                    if should_skip_row:
+                        chunks = pd.read_csv(csv_input, iterator=True, chunksize=chunksize,
+                                             header=0,
+                                             names=names,
+                                             dtype=dtype,
+                                             usecols=[n for n in names if n != ''],
+                                             skiprows=rows_to_skip)
+                    else:
+                        chunks = pd.read_csv(csv_input, iterator=True, chunksize=chunksize,
+                                             header=0,
+                                             names=names,
+                                             dtype=dtype,
+                                             usecols=[n for n in names if n != ''])
+
+                elif self.handle['columnMethod']['value'] == 'pick_from_file':
+                    _LOGGER.debug("We are picking header names from some index in the file.")
+                    column_row = int(self.handle['rowIndexForColumnNames']['value'])
+                    chunks = None
+                    if not should_skip_row and column_row == 0:
+                        chunks = ColumnarSidecar.find(csv_path, chunksize)
+                    if chunks is None and should_skip_row:
+                        chunks = pd.read_csv(csv_input, iterator=True, chunksize=chunksize,
+                                             header=column_row, skiprows=rows_to_skip)
+                    elif chunks is None:
+                        chunks = pd.read_csv(csv_input, iterator=True, chunksize=chunksize,
+                                             header=column_row)
+        except Exception:
+            if stream is not None:
+                stream.close()
+            raise
+
+        meta_data = None
         if self.handle['headerMethod']['value'] == 'pass_in_datapoint':
-
-            self.process_metadata = True
             with open(csv_path) as fd:
                 meta_data_array = [next(fd).strip('\n') for i in range(rows_to_skip)]
 
             meta_data_string = "_".join(meta_data_array)
-            self.meta_data = {self.handle['dataPointForCombine']['value']:
-                              meta_data_string}
-            _LOGGER.debug("The meta data picked from csv file {}".format(self.meta_data))
-            self.meta_data_ingested = False
+            meta_data = {self.handle['dataPointForCombine']['value']:
+                         meta_data_string}
 
-        self.file_iter = self.file_to_readings()
+        return CSVSource(chunks, meta_data, variable_columns, stream)
 
-    def file_to_readings(self):
-        """ file_of_readings - convert file of chunks of data into readings messages """
-        for chunk in self.df:
-            for readings in self.chunk_to_readings(chunk):
-                yield readings
+    def explicit_columns(self):
+        """ Returns the column names given by useColumns, '' for a column left out, and the dtype of the columns
+        having a type specifier, None if there is none
+        """
+        names = self.handle['useColumns']['value']
+        _LOGGER.debug("The column names explicitly given are {}".format(names))
+        has_type = ':' in names
+        names = [] if names == '' else names.split(',')
+        if has_type:
+            typeMap = {
+                'str': 'object',
+                'int': 'int64',
+                'float': 'float64',
+                'bool': 'bool_',
+                'timestamp': 'datetime64'
+            }
+            # column list can have a :type sepcifier
+            org_names = names
+            dtype = {}
+            names = []
+            for n in org_names:
+                if n == '':
+                    names.append(n)
+                else:
+                    nt = n.split(':')
+                    if len(nt) == 1:
+                        names.append(n)
+                    elif len(nt) == 2:
+                        if nt[1] not in ['str', 'int', 'float', 'timestamp', 'bool']:
+                            _LOGGER.error("{} must be in [str, int, float, timestamp, bool]".format(nt[1]))
+                            raise TypeError
+                        dtype[nt[0]] = typeMap[nt[1]]
+                        names.append(nt[0])
+                    else:
+                        _LOGGER.error("{} must be of the form <name>:<type>".format(nt))
+                        raise ValueError("{} must be of the form <name>:<type>".format(nt))
+        else:
+            dtype = None
+        return names, dtype
 
-    def validate_chunk(self, chunk):
-        for col_name in chunk.columns:
-            is_nan = chunk[col_name].isnull().values.any()  # check if NaN values
+    def record_chunks(self, csv_path, chunks):
+        """ Records the chunks of a file which will be played again into a replay cache, if enabled.
+        Sidecars need no parsing.
+        Args:
+            csv_path: The csv file being played
+            chunks: iterator over the chunks of the file
+        Returns:
+            iterator over the same chunks
+        """
+        budget = int(self.handle['replayCacheMemory']['value']) * 1024 * 1024
+        if budget == 0 or self.handle['postProcessMethod']['value'] != 'continue_playing' or \
+                self.process_variable_columns or isinstance(chunks, ColumnarSidecar):
+            return chunks
+        self.replay_cache = ReplayCache(csv_path, budget)
+        return self.replay_cache.record(chunks)
+
+    def repaired(self, chunks):
+        """ Fills the missing values of the chunks of a file, if enabled
+        Args:
+            chunks: iterator over the chunks of the file
+        Returns:
+            iterator over the chunks to play
+        """
+        if self.nan_repair is None or self.process_variable_columns:
+            return chunks
+        if self.handle['ignoreNaN']['value'] != 'ignore':
+            # the missing values are counted before they are filled
+            chunks = self.validated(chunks)
+        return self.nan_repair.stream(chunks)
+
+    def validated(self, chunks):
+        """ Counts the missing values of the chunks as they are read """
+        for chunk in chunks:
+            self.validate_chunk(chunk)
+            yield chunk
+
+    def close_replay_cache(self):
+        if self.replay_cache is not None:
+            self.replay_cache.close()
+            self.replay_cache = None
+
+    def close_stream(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+    def next_chunk(self):
+        """ Returns the next chunk of the file being played. At the end of the file the post process method is
+        applied and the next file, or the same one again, is loaded.
+        Returns:
+            DataFrame, None if there is no chunk right now
+        """
+        if self.df is None:
+            _LOGGER.info("File has been found. Playing it.")
+            self.read_csv_file()
+            if self.df is None:
+                return None
+        try:
+            return next(self.df)
+        except StopIteration:
+            _LOGGER.info('End of file reached.')
+            self.post_process_file()
+
+            # load the file once again.
+            self.read_csv_file()
+            if self.df is None:
+                _LOGGER.info("The next file could not be loaded. Waiting")
+            else:
+                _LOGGER.info("The next file loaded. Playing it...")
+            return None
+
+    def file_to_readings(self):
+        """ file_of_readings - convert file of chunks of data into readings messages """
+        for chunk in self.df:
+            last = None
+            for readings in self.chunk_to_readings(chunk):
+                if last is not None:
+                    yield last
+                last = readings
+            # the position is the one after the chunk once its last readings are handed over
+            self.commit()
+            if last is not None:
+                yield last
 
-            is_blank = chunk[col_name].astype(str).str.isspace().any()  # check if blank values are there
+    def validate_chunk(self, chunk):
+        """ Counts the missing values of a chunk per column. NaN's are looked for in the whole chunk at once,
+        blank values only in the text columns, as a numeric column holds none. The chunk where a
+        column first misses values is logged, the counts are reported once the file is played.
 
-            if is_nan or is_blank:
-                # checking either NaN or blank values
-                _LOGGER.error("There are NaN / missing values in the CSV file.")
-                _LOGGER.info("Going to shutdown csvplayback plugin.")
-                plugin_shutdown(self.handle)
+        Args:
+            chunk: DataFrame read from the csv file
+        Returns: None
+        """
+        missing = chunk.isnull().to_numpy().sum(axis=0)
+        for i in np.flatnonzero((chunk.dtypes == object).to_numpy()):
+            missing[i] += int(chunk.iloc[:, i].str.isspace().sum())
+
+        for i in np.flatnonzero(missing):
+            col_name = chunk.columns[i]
+            if col_name not in self.nan_counts:
+                if self.current_csv_file not in self.nan_reported:
+                    _LOGGER.error("There are NaN / missing values in column {} of the CSV file {}, in rows {} to {}."
+                                  .format(col_name, self.current_csv_file, self.nan_rows + 1,
+                                          self.nan_rows + len(chunk)))
+                self.nan_counts[col_name] = 0
+            self.nan_counts[col_name] += int(missing[i])
+            self.nan_total += int(missing[i])
+        self.nan_rows += len(chunk)
+
+    def report_nan(self):
+        """ Logs the missing values found in the file played, by column, and resets the counts for the next file
+        Returns: None
+        """
+        if self.nan_counts:
+            log = _LOGGER.debug if self.current_csv_file in self.nan_reported else _LOGGER.error
+            log("{} NaN / missing values in {} rows of the CSV file {}: {}".format(
+                sum(self.nan_counts.values()), self.nan_rows, self.current_csv_file,
+                ', '.join('{} {}'.format(col_name, count) for col_name, count in self.nan_counts.items())))
+            self.nan_reported.add(self.current_csv_file)
+        self.nan_counts = {}
+        self.nan_rows = 0
 
     def chunk_to_readings(self, chunk):
         """ chunk_to_readings -- convert multi-row chunk into "asset messages" containing readings
             modify timestamps to emulate different ingest assumptions
             yield results individually or in a batch
         """
-        timestamp = []
+        readings = self.chunk_readings(chunk)
+
+        if self.is_burst:
+            # burst mode - return all at once
+            if readings:
+                yield readings
+        else:
+            # continuous mode - return readings as you get them
+            # xxx - calculate error from desired vs actual return rate
+            yield from readings
+
+        return None
+
+    def chunk_readings(self, chunk):
+        """ Converts a multi-row chunk into the list of its readings, timestamps modified
+        to emulate different ingest assumptions
+
+        Args:
+            chunk: DataFrame read from the csv file
+        Returns:
+            list of readings, empty if the chunk yields none
+        """
+        start = time.perf_counter()
+        token = self.metrics.enter('convert')
+        try:
+            readings = self.convert_chunk(chunk)
+        finally:
+            self.metrics.leave(token)
+        self.rows_played += len(chunk)
+        self.metrics.add(conversions=1, readings=len(readings), convert=time.perf_counter() - start)
+        return readings
+
+    def convert_chunk(self, chunk):
+        """ Converts a multi-row chunk into the list of its readings, see chunk_readings """
+        chunk, timestamps, nanos = self.chunk_timestamps(chunk, keys=self.pack_window > 0)
+        if chunk is None:
+            return []
+        if self.pack_window:
+            return self.build_packed_readings(chunk, timestamps, nanos)
+        if self.is_array_burst:
+            return self.build_array_reading(chunk, timestamps[0]) if timestamps else []
+        return self.build_readings(chunk, timestamps)
+
+    def chunk_timestamps(self, chunk, keys=False):
+        """ Prepares a multi-row chunk for conversion into readings and gives timestamps to its rows
+
+        Args:
+            chunk: DataFrame read from the csv file
+            keys: Whether to also return the timestamps taken from the file as nanoseconds since the epoch (UTC),
+                for ordering readings
+        Returns:
+            tuple of the chunk to convert (None if it yields no reading), the list of timestamp strings and
+            the int64 array of keys (None unless asked for and the timestamps are taken from the file)
+        """
+        nanos = None
         if self.handle['variableCols']['value'] == 'false':
 
-            if self.handle['ignoreNaN']['value'] != 'ignore':
+            if self.handle['ignoreNaN']['value'] != 'ignore' and self.nan_repair is None:
                 self.validate_chunk(chunk)
         else:
             auto_prefix = self.handle['autoGeneratePrefix']['value']
@@ -708,223 +1876,2062 @@ class CSVReader:
                  for i, val in enumerate(chunk.iloc[0, :].values) if not pd.isnull(val)]
                 chunk = pd.DataFrame([main_dict])
             except IndexError:
-                return None
+                return None, [], None
 
-        if (self.ts_col != '') and (self.ts_col in chunk) and \
+        n_rows = len(chunk)
+        if self.is_burst:
+            # one local timestamp for the whole burst
+            timestamps = [str(utils.local_timestamp())] * n_rows
+        elif (self.ts_col != '') and (self.ts_col in chunk) and \
                 (self.is_historic_ts or self.is_delta_ts):
 
             # Modifying the time stamps; calculate new values, drop the old
             if self.is_historic_ts:
                 # asset timestamps become the data timestamps
-                ts_format = self.handle['timestampFormat']['value']
-                org_pd_col = chunk[self.ts_col]
-                timestamp = list(pd.to_datetime(org_pd_col, format=ts_format).array)
+                parsed = self.ts_parser.parse(chunk[self.ts_col])
+                timestamps = parsed.strings()
+                if keys:
+                    nanos = parsed.utc_nanos()
 
                 if self.is_drop_ts:
                     # don't include timestamps from files in actual readings
-                    chunk.drop(labels=self.ts_col, axis=1, inplace=True)
+                    chunk = chunk.drop(columns=self.ts_col)
             else:  # is_delta_ts
-                # Calculate time difference .This will be added to all readings except the first.
-                if self.ts_diff is None:
-                    org_pd_col = chunk[self.ts_col]
-                    ts_format = self.handle['timestampFormat']['value']
-                    ts_array = list(pd.to_datetime(org_pd_col, format=ts_format).array)
-                    self.ts_diff = ts_array[1] - ts_array[0]
-
-                for _ in range(chunk.shape[0]):
-                    timestamp.append(self.c)
-                    self.c = self.c + self.ts_diff
+                play = self.delta_nanos(chunk)
+                offset = int(pd.Timestamp(self.c).utcoffset().total_seconds()) // 60
+                wall = (play + offset * 60000000000).astype('datetime64[ns]').astype('datetime64[us]')
+                timestamps = ParsedTimestamps(wall, offset).strings()
+                if keys:
+                    nanos = play
 
         else:
             # 'use current time'
+            # continuous - make up timestamps based on a consistent delta from current time
             now_timestamp = datetime.datetime.now(datetime.timezone.utc).astimezone()
-            fraction = 1.0 / (max(1.0, len(chunk)))
+            fraction = 1.0 / (max(1.0, n_rows))
             uniform_interval = int(fraction * 1000000)
-            useconds = 0
+            wall_start = np.datetime64(now_timestamp.replace(microsecond=0, tzinfo=None), 'us')
+            wall = wall_start + np.arange(n_rows, dtype='int64') * np.timedelta64(uniform_interval, 'us')
+            timestamps = _format_wall_clock(wall, _utc_offset_suffix(now_timestamp.utcoffset()))
+
+        return chunk, timestamps, nanos
+
+    def delta_nanos(self, chunk):
+        """ Playback times of the rows of a chunk for the 'use csv sample delta' timestamp style.
+        The first row of a file is played at self.c. The others follow it by the fixed delta, or by their own
+        deltas in the file, carried over from chunk to chunk. self.c is moved to the time of the next row.
+
+        Args:
+            chunk: DataFrame read from the csv file
+        Returns:
+            int64 array of nanoseconds since the epoch (UTC)
+        """
+        n_rows = len(chunk)
+        start = pd.Timestamp(self.c)
+        if not self.is_delta_from_file:
+            # Calculate time difference .This will be added to all readings except the first.
+            if self.ts_diff is None:
+                first = self.ts_parser.parse(chunk[self.ts_col].iloc[:2]).utc_nanos()
+                self.ts_diff = pd.Timedelta(int(first[1] - first[0]), unit='ns')
+            self.c = start + n_rows * self.ts_diff
+            return start.value + np.arange(n_rows, dtype='int64') * self.ts_diff.value
+
+        file_times = self.ts_parser.parse(chunk[self.ts_col]).utc_nanos()
+        missing = file_times == np.iinfo('int64').min
+        if missing.all():
+            # no time in the chunk, the rows follow each other by the last delta
+            file_times = np.arange(n_rows, dtype='int64') * self.delta_step
+            if self.delta_anchor is not None:
+                file_times += self.delta_anchor[1] + self.delta_step
+        elif missing.any():
+            # a missing time is taken as the time of the row before
+            first = int(np.argmax(~missing))
+            index = np.where(missing, 0, np.arange(n_rows))
+            index[:first] = first
+            file_times = file_times[np.maximum.accumulate(index)]
+            if first and self.delta_anchor is not None:
+                file_times[:first] = self.delta_anchor[1]
+
+        if self.delta_anchor is None:
+            play = start.value + (file_times - file_times[0])
+        else:
+            last_play, last_file = self.delta_anchor
+            play = last_play + (file_times - last_file)
+        if n_rows > 1:
+            self.delta_step = int(file_times[-1] - file_times[-2])
+        self.delta_anchor = (int(play[-1]), int(file_times[-1]))
+        self.c = pd.Timestamp(int(play[-1]) + self.delta_step, unit='ns', tz='UTC').tz_convert(start.tz)
+        return play
+
+    def build_readings(self, chunk, timestamps):
+        """ Builds reading dicts for a chunk column by column
+
+        Args:
+            chunk: DataFrame of rows to convert
+            timestamps: list of timestamp strings, one per row of the chunk
+        Returns:
+            list of readings in the order of the rows of the chunk
+        """
+        names = list(chunk.columns)
+        # Series.tolist gives native python values, the same as DataFrame.to_dict('records')
+        columns = [chunk.iloc[:, i].tolist() for i in range(len(names))]
+        rows = zip(*columns) if columns else [()] * len(chunk)
+        asset = self.asset_name
+
+        if self.process_metadata:
+            names.extend(self.meta_data.keys())
+            extra = tuple(self.meta_data.values())
+            rows = (row + extra for row in rows)
+        if self.is_burst:
+            # the rows of a burst share one timestamp
+            ts = timestamps[0] if timestamps else None
+            readings = [{'asset': asset, 'timestamp': ts, 'readings': dict(zip(names, row))} for row in rows]
+        else:
+            readings = [{'asset': asset, 'timestamp': ts, 'readings': dict(zip(names, row))}
+                        for ts, row in zip(timestamps, rows)]
+        if readings and self.process_metadata:
+            self.meta_data_ingested = True
+        return readings
+
+    def array_datapoints(self, chunk):
+        """ Returns the numeric columns of a chunk as numpy arrays by name, the other columns are left out """
+        arrays = {}
+        for name in chunk.columns:
+            values = chunk[name]
+            if values.dtype.kind in 'biuf':
+                arrays[name] = values.to_numpy()
+            elif name != self.ts_col and name not in self.unpacked_columns:
+                _LOGGER.warning("Column {} is not numeric, it is left out of the array datapoints.".format(name))
+                self.unpacked_columns.add(name)
+        return arrays
+
+    def build_packed_readings(self, chunk, timestamps, nanos):
+        """ Packs every pack_window consecutive rows of a chunk into one reading, timestamped with its first row.
+        Every numeric column becomes an array datapoint, startTimestamp and sampleInterval (seconds between two
+        rows) datapoints describe the samples. The last reading of a chunk packs the rows left.
+
+        Args:
+            chunk: DataFrame of rows to convert
+            timestamps: list of timestamp strings, one per row of the chunk
+            nanos: int64 array of the timestamps of the rows as nanoseconds, None if they are not taken from the
+                file; the rows are then spread over a second
+        Returns:
+            list of readings
+        """
+        n_rows = len(chunk)
+        arrays = self.array_datapoints(chunk)
+        metadata = self.meta_data if self.process_metadata else {}
+        # rows spread over a second, as in chunk_timestamps
+        interval = int(1.0 / max(1.0, n_rows) * 1000000) / 1e6
 
         readings = []
-        for row_values in chunk.to_dict('records'):
-            if self.is_burst:
-                # uniform local timestamp for burst mode
-                modified_timestamp = str(utils.local_timestamp())
-            elif len(timestamp) != 0:
-                # continuous - we've created new timestamps for this chunk, use them
-                modified_timestamp = str(timestamp.pop(0))
+        for start in range(0, n_rows, self.pack_window):
+            end = min(start + self.pack_window, n_rows)
+            datapoints = {name: values[start:end].tolist() for name, values in arrays.items()}
+            datapoints['startTimestamp'] = timestamps[start]
+            if nanos is not None:
+                # a window of one row takes the interval to its neighbour
+                first, last = (start, end - 1) if end - start > 1 else (max(start - 1, 0), min(start + 1, n_rows - 1))
+                interval = (int(nanos[last]) - int(nanos[first])) / max(last - first, 1) / 1e9
+            datapoints['sampleInterval'] = interval
+            datapoints.update(metadata)
+            readings.append({'asset': self.asset_name, 'timestamp': timestamps[start], 'readings': datapoints})
+        if readings and self.process_metadata:
+            self.meta_data_ingested = True
+        return readings
+
+    def build_array_reading(self, chunk, timestamp):
+        """ Packs a burst into one reading, every numeric column becoming an array datapoint holding the values
+        of all the rows. Metadata values are single datapoints.
+
+        Args:
+            chunk: DataFrame of the rows of the burst
+            timestamp: timestamp string of the burst
+        Returns:
+            list of the reading, empty if the burst has no row
+        """
+        if not len(chunk):
+            return []
+        datapoints = {name: values.tolist() for name, values in self.array_datapoints(chunk).items()}
+        if self.process_metadata:
+            datapoints.update(self.meta_data)
+            self.meta_data_ingested = True
+        return [{'asset': self.asset_name, 'timestamp': timestamp, 'readings': datapoints}]
+
+
+def _utc_offset_suffix(offset):
+    """ Formats a UTC offset the way str(datetime) does, e.g. '+05:30' """
+    if offset is None:
+        return ''
+    minutes = int(offset.total_seconds()) // 60
+    sign = '-' if minutes < 0 else '+'
+    return '{}{:02d}:{:02d}'.format(sign, abs(minutes) // 60, abs(minutes) % 60)
+
+
+def _format_wall_clock(wall, suffix):
+    """ Formats an array of datetime64 wall clock times into Fledge timestamp strings in one pass.
+    The characters of all the strings are computed at once into an array of code points, which becomes the list
+    of strings in a single conversion. As with str(datetime), the fraction is left out of times on a whole second.
+
+    Args:
+        wall: numpy datetime64 array of local (wall clock) times
+        suffix: UTC offset suffix appended to every timestamp, or a list with one suffix per timestamp
+    Returns:
+        list of str like '2018-05-08 14:06:40.517313+05:30' or '2018-05-08 14:06:40+05:30', 'NaT' for missing times
+    """
+    micros = wall.astype('datetime64[us]')
+    nat = np.isnat(micros)
+    if nat.any():
+        micros = np.where(nat, np.datetime64(0, 'us'), micros)
+    days = micros.astype('datetime64[D]')
+    months = days.astype('datetime64[M]')
+    years = months.astype('datetime64[Y]')
+    year = years.astype('int64') + 1970
+    if isinstance(suffix, str):
+        suffix_codes = np.array([ord(c) for c in suffix], dtype=np.uint32)
+    else:
+        suffix_codes = np.array(suffix, dtype=str)
+        suffix_width = suffix_codes.dtype.itemsize // 4
+        if len(set(len(sfx) for sfx in suffix)) > 1:
+            suffix_codes = None
+        else:
+            suffix_codes = suffix_codes.view(np.uint32).reshape(len(suffix), suffix_width)
+    if suffix_codes is None or (len(year) and (year.min() < 0 or year.max() > 9999)):
+        # outside of the fixed layout
+        iso = np.datetime_as_string(wall.astype('datetime64[us]'), unit='us').tolist()
+        if isinstance(suffix, str):
+            formatted = [s.replace('T', ' ') + suffix for s in iso]
+        else:
+            formatted = [s.replace('T', ' ') + sfx for s, sfx in zip(iso, suffix)]
+        for i in np.flatnonzero(micros.astype('int64') % 1000000 == 0).tolist():
+            formatted[i] = formatted[i].replace('.000000', '', 1)
+    else:
+        day_micros = (micros - days).astype('int64')
+        seconds = (day_micros // 1000000).astype('int32')
+        width = 26 + suffix_codes.shape[-1]
+        # one row per character while filling it, contiguous
+        text = np.empty((width, len(micros)), dtype=np.uint32)
+
+        def put(column, values, n_digits):
+            for place in range(column + n_digits - 1, column - 1, -1):
+                values, digit = np.divmod(values, 10)
+                text[place] = digit + 48
+
+        put(0, year.astype('int32'), 4)
+        put(5, (months - years).astype('int32') + 1, 2)
+        put(8, (days - months).astype('int32') + 1, 2)
+        put(11, seconds // 3600, 2)
+        put(14, seconds // 60 % 60, 2)
+        put(17, seconds % 60, 2)
+        put(20, (day_micros % 1000000).astype('int32'), 6)
+        for column, char in ((4, '-'), (7, '-'), (10, ' '), (13, ':'), (16, ':'), (19, '.')):
+            text[column] = ord(char)
+        text[26:] = suffix_codes.T if suffix_codes.ndim == 2 else suffix_codes[:, np.newaxis]
+        whole = np.flatnonzero(day_micros % 1000000 == 0)
+        if len(whole):
+            # the suffix moves in place of the fraction, the trailing null characters end the string
+            text[19:width - 7, whole] = text[26:, whole]
+            text[width - 7:, whole] = 0
+        formatted = np.ascontiguousarray(text.T).view('U{}'.format(width)).ravel().tolist()
+    for i in np.flatnonzero(nat).tolist():
+        formatted[i] = 'NaT'
+    return formatted
+
+
+def _format_timestamps(timestamps):
+    """ Formats parsed pandas timestamps into Fledge timestamp strings in bulk
+
+    Args:
+        timestamps: datetime like Series/Index, either naive or time zone aware
+    Returns:
+        list of str like '2018-05-08 14:06:40.517313+05:30'
+    """
+    try:
+        index = pd.DatetimeIndex(timestamps)
+    except (TypeError, ValueError):
+        # e.g. mixed UTC offsets in a single column; format them one by one
+        return [str(ts) for ts in timestamps]
+
+    if index.tz is None:
+        return _format_wall_clock(index.values, '')
+
+    wall = index.tz_localize(None).values
+    utc = index.tz_convert('UTC').tz_localize(None).values
+    return _format_with_offsets(wall, (wall - utc).astype('timedelta64[m]').astype('int64'))
+
+
+def _format_with_offsets(wall, offsets):
+    """ Formats wall clock times having UTC offsets into Fledge timestamp strings in bulk
+
+    Args:
+        wall: numpy datetime64 array of wall clock times
+        offsets: UTC offsets in minutes, None for naive times, an int for all times or an int64 array
+    Returns:
+        list of str like '2018-05-08 14:06:40.517313+05:30'
+    """
+    if offsets is None:
+        return _format_wall_clock(wall, '')
+    if isinstance(offsets, int):
+        return _format_wall_clock(wall, _utc_offset_suffix(datetime.timedelta(minutes=offsets)))
+    offsets = offsets.copy()
+    offsets[np.isnat(wall)] = 0
+    unique_offsets = np.unique(offsets)
+    if len(unique_offsets) == 1:
+        return _format_wall_clock(wall, _utc_offset_suffix(datetime.timedelta(minutes=int(unique_offsets[0]))))
+    suffixes = {m: _utc_offset_suffix(datetime.timedelta(minutes=m)) for m in unique_offsets.tolist()}
+    return _format_wall_clock(wall, [suffixes[m] for m in offsets.tolist()])
+
+
+def _utc_nanos(timestamps):
+    """ Converts parsed pandas timestamps into nanoseconds since the epoch (UTC), naive ones being taken as UTC
+
+    Args:
+        timestamps: datetime like Series/Index, either naive or time zone aware
+    Returns:
+        int64 numpy array
+    """
+    try:
+        index = pd.DatetimeIndex(timestamps)
+    except (TypeError, ValueError):
+        # mixed UTC offsets
+        index = pd.DatetimeIndex(pd.to_datetime(timestamps, utc=True))
+    if index.tz is not None:
+        index = index.tz_convert('UTC').tz_localize(None)
+    return index.values.astype('datetime64[ns]').astype('int64')
+
+
+class ParsedTimestamps:
+    """ Timestamps parsed from a column: wall clock times along with their UTC offsets """
+
+    def __init__(self, wall, offsets):
+        """
+        Args:
+            wall: numpy datetime64[us] array of wall clock times, NaT for missing times
+            offsets: UTC offsets in minutes, None for naive times, an int for all times or an int64 array
+        """
+        self.wall = wall
+        self.offsets = offsets
+
+    @classmethod
+    def from_pandas(cls, timestamps):
+        """ Takes the timestamps parsed by pandas """
+        try:
+            index = pd.DatetimeIndex(timestamps)
+        except (TypeError, ValueError):
+            # mixed UTC offsets
+            offsets = np.array([0 if pd.isnull(ts) else int(ts.utcoffset().total_seconds()) // 60
+                                for ts in timestamps], dtype='int64')
+            utc = pd.DatetimeIndex(pd.to_datetime(timestamps, utc=True)).tz_localize(None).values
+            return cls(utc.astype('datetime64[us]') + offsets.astype('timedelta64[m]'), offsets)
+        if index.tz is None:
+            return cls(index.values.astype('datetime64[us]'), None)
+        wall = index.tz_localize(None).values
+        utc = index.tz_convert('UTC').tz_localize(None).values
+        return cls(wall.astype('datetime64[us]'), (wall - utc).astype('timedelta64[m]').astype('int64'))
+
+    def strings(self):
+        """ Returns the Fledge timestamp strings """
+        return _format_with_offsets(self.wall, self.offsets)
+
+    def utc_nanos(self):
+        """ Returns nanoseconds since the epoch (UTC) as an int64 array, naive times being taken as UTC """
+        utc = self.wall.astype('datetime64[ns]')
+        if self.offsets is not None:
+            utc = utc - np.asarray(self.offsets, dtype='int64').astype('timedelta64[m]')
+        return utc.astype('int64')
+
+
+class TimestampParser:
+    """ Parses the timestamp column of chunks into ParsedTimestamps, vectorized.
+
+    A format made of %Y %m %d %H %M %S %f %z and literal characters, like the default one, is parsed straight
+    from the bytes of the strings with numpy arithmetic, once all the strings of the chunk have the same
+    layout. 'ISO8601' recognises the ISO 8601 layouts. Numeric columns are epoch times in seconds,
+    milliseconds, microseconds or nanoseconds, told apart by their magnitude. Anything else is parsed by pandas.
+    A parser is compiled once per format and cached.
+    """
+
+    WIDTHS = {'Y': 4, 'm': 2, 'd': 2, 'H': 2, 'M': 2, 'S': 2}
+    # epoch unit by magnitude of the values: above 1e17 nanoseconds, 1e14 microseconds, 1e11 milliseconds
+    EPOCH_UNITS = ((1e17, 1e-3), (1e14, 1), (1e11, 1e3), (0, 1e6))  # (magnitude, microseconds per unit)
+
+    _compiled = {}
+
+    @classmethod
+    def for_format(cls, ts_format):
+        parser = cls._compiled.get(ts_format)
+        if parser is None:
+            parser = cls._compiled[ts_format] = cls(ts_format)
+        return parser
+
+    def __init__(self, ts_format):
+        self.ts_format = ts_format
+        if ts_format == 'ISO8601':
+            self.candidates = [self.tokenize('%Y-%m-%d{}%H:%M:%S{}{}'.format(sep, fraction, zone))
+                               for sep in 'T ' for fraction in ['.%f', ''] for zone in ['%z', '']]
+        else:
+            tokens = self.tokenize(ts_format)
+            self.candidates = [tokens] if tokens is not None else []
+        # formats like %Y%m%d%H%M%S are read as numbers by pandas, they are not epoch times
+        self.digits_only = any(all(kind in self.WIDTHS for kind, _ in tokens) for tokens in self.candidates)
+        self.layouts = {}  # width of the strings -> layout, None if it does not fit the format
+
+    @classmethod
+    def tokenize(cls, ts_format):
+        """ Splits a format into directives and literals.
+        Returns:
+            list of (directive, None) and ('', literal), None if the format has other directives
+        """
+        tokens = []
+        i = 0
+        while i < len(ts_format):
+            if ts_format[i] != '%':
+                tokens.append(('', ts_format[i]))
+                i += 1
+                continue
+            directive = ts_format[i + 1:i + 2]
+            if directive not in cls.WIDTHS and directive not in ('f', 'z'):
+                return None
+            tokens.append((directive, None))
+            i += 2
+        return tokens
+
+    @classmethod
+    def layout(cls, tokens, sample):
+        """ Places the fields of a format in a sample string.
+        Returns:
+            dict of directive -> (start, width) and the list of (start, literal); None if the sample does not fit
+        """
+        fields = {}
+        literals = []
+        pos = 0
+        for directive, literal in tokens:
+            if directive == '':
+                if sample[pos:pos + 1] != literal:
+                    return None
+                literals.append((pos, literal))
+                pos += 1
+            elif directive in cls.WIDTHS:
+                width = cls.WIDTHS[directive]
+                if not sample[pos:pos + width].isdigit() or len(sample[pos:pos + width]) != width:
+                    return None
+                fields[directive] = (pos, width)
+                pos += width
+            elif directive == 'f':
+                width = len(sample[pos:]) - len(sample[pos:].lstrip('0123456789'))
+                if not 1 <= width <= 9:
+                    return None
+                fields['f'] = (pos, width)
+                pos += width
+            else:  # z
+                zone = sample[pos:]
+                if zone == 'Z':
+                    fields['z'] = (pos, 1)
+                elif len(zone) in (5, 6) and zone[0] in '+-' and zone[1:3].isdigit() and zone[-2:].isdigit():
+                    if len(zone) == 6 and zone[3] != ':':
+                        return None
+                    fields['z'] = (pos, len(zone))
+                else:
+                    return None
+                pos += len(zone)
+        if pos != len(sample):
+            return None
+        return fields, literals
+
+    def parse(self, column):
+        """ Parses the timestamp column of a chunk.
+        Args:
+            column: Series of timestamp strings or epoch times
+        Returns:
+            ParsedTimestamps
+        """
+        if column.dtype.kind in 'iuf':
+            if not self.digits_only:
+                return self.parse_epoch(column.to_numpy(dtype='float64'))
+            parsed = None
+        else:
+            parsed = self.parse_fixed(column) if self.candidates and len(column) else None
+        if parsed is None:
+            parsed = ParsedTimestamps.from_pandas(pd.to_datetime(column, format=self.ts_format))
+        return parsed
+
+    def parse_epoch(self, values):
+        finite = values[np.isfinite(values)]
+        scale = 1e6
+        if len(finite):
+            magnitude = abs(finite[0])
+            scale = next(per_unit for bound, per_unit in self.EPOCH_UNITS if magnitude >= bound)
+        micros = np.round(values * scale)
+        wall = np.where(np.isfinite(micros), micros, 0).astype('int64').astype('datetime64[us]')
+        wall[~np.isfinite(micros)] = np.datetime64('NaT')
+        # epoch times are UTC
+        return ParsedTimestamps(wall, 0)
+
+    def parse_fixed(self, column):
+        """ Parses strings which all have the same layout, straight from their bytes.
+        Returns:
+            ParsedTimestamps, None if the strings do not all fit a layout of the format
+        """
+        try:
+            raw = column.to_numpy(dtype='S')
+        except (UnicodeEncodeError, TypeError, ValueError):
+            return None
+        width = raw.dtype.itemsize
+        if width not in self.layouts:
+            sample = raw[0].decode('ascii', errors='replace')
+            fits = [self.layout(tokens, sample) for tokens in self.candidates]
+            self.layouts[width] = next((fit for fit in fits if fit is not None and len(sample) == width), None)
+        layout = self.layouts[width]
+        if layout is None:
+            return None
+        fields, literals = layout
+
+        chars = raw.view(np.uint8).reshape(len(raw), width)
+        for start, literal in literals:
+            if not (chars[:, start] == ord(literal)).all():
+                return None
+        digits = chars - np.uint8(48)  # wraps around for non digits
+
+        def number(directive):
+            start, field_width = fields[directive]
+            part = digits[:, start:start + field_width]
+            if (part > 9).any():
+                raise ValueError
+            return part.astype('int64') @ (10 ** np.arange(field_width - 1, -1, -1, dtype='int64'))
+
+        try:
+            year, month, day = number('Y'), number('m'), number('d')
+            seconds = np.zeros(len(raw), dtype='int64')
+            for directive, factor, limit in (('H', 3600, 23), ('M', 60, 59), ('S', 1, 59)):
+                if directive in fields:
+                    value = number(directive)
+                    if (value > limit).any():
+                        return None
+                    seconds += value * factor
+            micros = seconds * 1000000
+            if 'f' in fields:
+                fraction = number('f')
+                field_width = fields['f'][1]
+                if field_width <= 6:
+                    micros += fraction * 10 ** (6 - field_width)
+                else:
+                    micros += fraction // 10 ** (field_width - 6)
+            offsets = None
+            if 'z' in fields:
+                start, zone_width = fields['z']
+                if zone_width == 1:
+                    if not (chars[:, start] == ord('Z')).all():
+                        return None
+                    offsets = 0
+                else:
+                    sign = chars[:, start]
+                    if not np.isin(sign, [ord('+'), ord('-')]).all():
+                        return None
+                    hours = digits[:, start + 1:start + 3]
+                    minutes = digits[:, start + zone_width - 2:start + zone_width]
+                    if (hours > 9).any() or (minutes > 9).any():
+                        return None
+                    tens = np.array([10, 1], dtype='int64')
+                    offsets = (hours.astype('int64') @ tens) * 60 + minutes.astype('int64') @ tens
+                    offsets = np.where(sign == ord('-'), -offsets, offsets)
+                    if (offsets == offsets[0]).all():
+                        offsets = int(offsets[0])
+        except ValueError:
+            return None
+
+        if (month < 1).any() or (month > 12).any() or (day < 1).any():
+            return None
+        months = (year - 1970).astype('datetime64[Y]').astype('datetime64[M]') + (month - 1)
+        dates = months.astype('datetime64[D]') + (day - 1)
+        if (dates.astype('datetime64[M]') != months).any():
+            # day out of the month
+            return None
+        wall = dates.astype('datetime64[us]') + micros.astype('timedelta64[us]')
+        return ParsedTimestamps(wall, offsets)
+
+
+def _inflate(new_decompressor, decompressor, data):
+    """ Decompresses bytes made of whole or partial members.
+    Args:
+        new_decompressor: Returns the decompressor of a member
+        decompressor: Decompressor of the member the bytes begin within, None if they begin a member
+        data: The compressed bytes
+    Returns:
+        the decompressed bytes, decompressor of the member the bytes end within or None if they end a member
+    """
+    out = []
+    while data:
+        if decompressor is None:
+            if not data.strip(b'\0'):
+                break  # padding after the last member
+            decompressor = new_decompressor()
+        out.append(decompressor.decompress(data))
+        if not decompressor.eof:
+            return b''.join(out), decompressor
+        data, decompressor = decompressor.unused_data, None
+    return b''.join(out), None
+
+
+class DecompressedStream(io.RawIOBase):
+    """ The decompressed bytes of a compressed csv file, for pandas to parse while the next ones are being
+    decompressed in the background.
+
+    A thread reads the file and cuts it into segments beginning where a member begins. Segments are decompressed
+    by a pool of threads (zlib, bz2, zstd and lz4 release the GIL), so that files made of many members, like the
+    ones of bgzip, pigz --independent, pbzip2 or pzstd, are decompressed on several cores. A member larger than a
+    segment, as in a file compressed by gzip or bzip2, is decompressed in order by the thread itself.
+    A pattern may also match within a member: the segment is then decompressed in order as well.
+    """
+
+    PIECE = 1024 * 1024  # compressed bytes read at once
+    SEGMENT = 256 * 1024  # least compressed bytes of a segment
+    AHEAD = 8  # segments decompressed ahead of the parser
+
+    def __init__(self, path, pattern, new_decompressor, threads):
+        super().__init__()
+        self.path = path
+        self.pattern = pattern
+        self.new_decompressor = new_decompressor
+        self.threads = threads
+        self.queue = queue.Queue(self.AHEAD)  # decompressed bytes, then None at the end or the exception raised
+        self.view = memoryview(b'')
+        self.pos = 0
+        self.ended = False
+        self.begins_member = True  # whether the next segment begins a member, as far as the pattern tells
+        self.stop = Event()
+        self.thread = Thread(target=self.run, name='CSVDecompress', daemon=True)
+        self.thread.start()
+
+    @classmethod
+    def open(cls, path, threads):
+        """ Starts decompressing a file, returns None if it is not compressed, or if threads is 0 and pandas
+        can decompress it
+        """
+        for extension, (pattern, new_decompressor) in _CODECS.items():
+            if path.endswith(extension):
+                if threads == 0 and extension in _PANDAS_CODECS:
+                    return None
+                _LOGGER.debug("Decompressing {} with {} threads".format(path, max(threads, 1)))
+                return cls(path, pattern, new_decompressor, max(threads, 1))
+        return None
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while self.pos == len(self.view):
+            if self.ended:
+                return 0
+            data = self.queue.get()
+            if data is None or isinstance(data, Exception):
+                self.ended = True
+                if data is not None:
+                    raise data
+                continue
+            self.view, self.pos = memoryview(data), 0
+        n = min(len(buffer), len(self.view) - self.pos)
+        buffer[:n] = self.view[self.pos:self.pos + n]
+        self.pos += n
+        return n
+
+    def close(self):
+        self.stop.set()
+        super().close()
+
+    def put(self, item):
+        """ Queues an item for the parser, False if the stream has been closed meanwhile """
+        while not self.stop.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def cut(self, data, final):
+        """ Cuts segments off the compressed bytes read so far.
+        Args:
+            data: The compressed bytes following the last segment
+            final: Whether data reaches the end of the file
+        Returns:
+            list of (segment, whether it begins a member), the bytes left
+        """
+        segments = []
+        while data:
+            match = self.pattern.search(data, self.SEGMENT)
+            if match is not None:
+                end, begins_member = match.start(), True
+            elif final:
+                end, begins_member = len(data), True
+            elif len(data) >= self.PIECE:
+                # no member begins in the piece, keeping a partial pattern for the next one
+                end, begins_member = len(data) - 16, False
             else:
-                # continuous - else, make up a timestamp based on a consistent delta from current time
-                modified_timestamp = str(now_timestamp.replace(microsecond=useconds))
-                useconds += uniform_interval
-
-            if self.process_metadata:
-                row_values.update(self.meta_data)
-                reading = {
-                    'asset': self.asset_name,
-                    'timestamp': modified_timestamp,
-                    'readings': row_values
-                }
-                self.meta_data_ingested = True
+                break
+            segments.append((data[:end], self.begins_member))
+            self.begins_member = begins_member
+            data = data[end:]
+        return segments, data
+
+    def run(self):
+        try:
+            with open(self.path, 'rb') as fd, ThreadPoolExecutor(self.threads, 'CSVInflate') as pool:
+                pending = collections.deque()  # (segment, future of its decompression if it begins a member)
+                decompressor = None  # decompressor of the member the next pending segment begins within
+                data = b''
+                while not self.stop.is_set():
+                    piece = fd.read(self.PIECE)
+                    segments, data = self.cut(data + piece, not piece)
+                    for segment, begins_member in segments:
+                        future = pool.submit(_inflate, self.new_decompressor, None, segment) \
+                            if begins_member else None
+                        pending.append((segment, future))
+                    while pending and (len(pending) > 2 * self.threads or not piece):
+                        segment, future = pending.popleft()
+                        if decompressor is None and future is not None:
+                            out, decompressor = future.result()
+                        else:
+                            out, decompressor = _inflate(self.new_decompressor, decompressor, segment)
+                        if out and not self.put(out):
+                            break
+                    if not piece:
+                        if decompressor is not None:
+                            raise EOFError("{} ends within a compressed member".format(self.path))
+                        break
+            self.put(None)
+        except Exception as ex:
+            self.put(ex)
+
+
+class CSVSource:
+    """ A csv file opened for playing: its chunks and what has been read from its header """
+
+    def __init__(self, chunks, meta_data=None, variable_columns=False, stream=None):
+        self.chunks = chunks
+        self.meta_data = meta_data
+        self.variable_columns = variable_columns
+        self.stream = stream  # DecompressedStream of a compressed file
+        self.first = None  # first chunk, if parsed ahead
+
+    def read_ahead(self):
+        """ Parses the first chunk """
+        self.first = next(self.chunks, None)
+
+    def iterator(self):
+        """ Returns the iterator over the chunks, starting with the chunk parsed ahead """
+        if self.first is None:
+            return self.chunks
+        first, self.first = self.first, None
+        return itertools.chain([first], self.chunks)
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.close()
+
+
+class Prefetch(Thread):
+    """ Opens a csv file and parses its first chunk in the background """
+
+    def __init__(self, reader, csv_path):
+        """
+        Args:
+            reader: The reader class object
+            csv_path: The csv file to read ahead
+        """
+        super(Prefetch, self).__init__(name='Prefetch', daemon=True)
+        self.reader = reader
+        self.csv_path = csv_path
+        self.identity = None
+        self.source = None
+
+    def run(self):
+        try:
+            self.identity = _file_identity(self.csv_path)
+            if not self.identity or self.identity[0] == 0:
+                return
+            _import_pandas()
+            source = self.reader.open_source(self.csv_path)
+            source.read_ahead()
+            self.source = source
+        except Exception as ex:
+            # the file is opened again when its turn comes, which reports the error
+            _LOGGER.warning("Could not read ahead {}: {}".format(self.csv_path, ex))
+
+    def result(self):
+        """ Waits for the read ahead to finish and returns the CSVSource, None if it failed """
+        self.join()
+        return self.source
+
+    def discard(self):
+        source = self.result()
+        self.source = None
+        if source is not None:
+            source.close()
+
+
+def _line_offsets(buffer, header_lines, stride, block):
+    """ Scans the contents of a csv file for line breaks.
+
+    Args:
+        buffer: The contents of the file, e.g. a memory map
+        header_lines: No. of lines before the first row of values
+        stride: Every stride-th row of values is indexed, the first one included
+        block: Bytes scanned at a time
+    Returns:
+        list of the byte offsets where the indexed rows begin, no. of rows of values
+    """
+    size = len(buffer)
+    view = np.frombuffer(buffer, dtype=np.uint8)
+    offsets = [0] if header_lines == 0 else []
+    line = 0  # no. of the line beginning after the newlines of a block
+    for block_start in range(0, size, block):
+        starts = np.flatnonzero(view[block_start:block_start + block] == 10) + (block_start + 1)
+        data_lines = np.arange(line + 1, line + 1 + len(starts)) - header_lines
+        offsets.extend(starts[(data_lines >= 0) & (data_lines % stride == 0)].tolist())
+        line += len(starts)
+    del view  # a memory map can not be closed while a buffer is exported
+    if size and buffer[size - 1:] != b'\n':
+        line += 1
+    offsets = [offset for offset in offsets if offset < size]
+    return offsets, max(line - header_lines, 0)
+
+
+class RowIndex:
+    """ Sparse index of the rows of an uncompressed csv file: the byte offset of every STRIDE-th row of values,
+    and the earliest and latest time of each block of STRIDE rows.
+
+    The index is built on first use by scanning the file for line breaks, and saved beside the file as
+    <file>.rowidx along with the size and modification time of the file it matches. The times of the blocks are
+    added on the first use of a time window, by parsing the timestamp column once. Rows are counted as lines:
+    the rows of the file should not hold line breaks within quoted values, nor be blank.
+    """
+
+    STRIDE = 10000
+    INDEX_BLOCK = 64 * 1024 * 1024  # bytes scanned at a time while indexing line offsets
+    VERSION = 1
+
+    def __init__(self, path, identity, header_lines, offsets, n_rows):
+        self.path = path
+        self.identity = identity
+        self.header_lines = header_lines
+        self.offsets = offsets
+        self.n_rows = n_rows
+        self.time_key = None  # column and format of the times of the blocks, None if there are none
+        self.time_min = None  # earliest time of every block in ns since the epoch UTC, int64 max if none
+        self.time_max = None  # latest time of every block, int64 min if none
+
+    @classmethod
+    def load(cls, csv_path, header_lines):
+        """ Returns the index of a csv file, built and saved unless the saved one matches the file """
+        identity = _file_identity(csv_path)
+        try:
+            with np.load(csv_path + _INDEX_SUFFIX) as saved:
+                if int(saved['version']) == cls.VERSION and tuple(saved['identity'].tolist()) == identity and \
+                        int(saved['header_lines']) == header_lines and int(saved['stride']) == cls.STRIDE:
+                    index = cls(csv_path, identity, header_lines, saved['offsets'], int(saved['n_rows']))
+                    if 'time_key' in saved:
+                        index.time_key = str(saved['time_key'])
+                        index.time_min, index.time_max = saved['time_min'], saved['time_max']
+                    return index
+        except (OSError, ValueError, KeyError):
+            pass
+        index = cls.build(csv_path, header_lines)
+        index.save()
+        return index
+
+    @classmethod
+    def build(cls, csv_path, header_lines):
+        start = time.perf_counter()
+        with open(csv_path, 'rb') as fd:
+            identity = _file_identity(csv_path)
+            offsets, n_rows = [], 0
+            if identity[0]:
+                with mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    offsets, n_rows = _line_offsets(mm, header_lines, cls.STRIDE, cls.INDEX_BLOCK)
+        _LOGGER.info("Indexed {} rows of {} in {:.3f} sec".format(n_rows, csv_path, time.perf_counter() - start))
+        return cls(csv_path, identity, header_lines, np.array(offsets, dtype='int64'), n_rows)
+
+    def save(self):
+        times = {}
+        if self.time_key is not None:
+            times = {'time_key': self.time_key, 'time_min': self.time_min, 'time_max': self.time_max}
+        try:
+            with open(self.path + _INDEX_SUFFIX, 'wb') as fd:
+                np.savez(fd, version=self.VERSION, identity=np.array(self.identity, dtype='int64'),
+                         header_lines=self.header_lines, stride=self.STRIDE, offsets=self.offsets,
+                         n_rows=self.n_rows, **times)
+        except OSError as ex:
+            _LOGGER.warning("The row index of {} could not be saved: {}".format(self.path, ex))
+
+    def offset(self, row):
+        """ Returns the byte offset where a row of values begins, None past the last row """
+        if row >= self.n_rows:
+            return None
+        block, rest = divmod(row, self.STRIDE)
+        offset = int(self.offsets[block])
+        if rest:
+            with open(self.path, 'rb') as fd:
+                fd.seek(offset)
+                for _ in range(rest):
+                    fd.readline()
+                offset = fd.tell()
+        return offset
+
+    def index_times(self, column, ts_format):
+        """ Adds the earliest and latest time of every block, unless the index has them already.
+        Args:
+            column: Position of the timestamp column in the rows
+            ts_format: Format of the timestamps
+        Returns:
+            True if the index has the times of the blocks
+        """
+        key = '{}|{}'.format(column, ts_format)
+        if self.time_key == key:
+            return True
+        start = time.perf_counter()
+        parser = TimestampParser.for_format(ts_format)
+        missing = np.iinfo('int64').min
+        time_min, time_max = [], []
+        for block in pd.read_csv(self.path, header=None, skiprows=self.header_lines, usecols=[column],
+                                 chunksize=self.STRIDE):
+            file_times = parser.parse(block[column]).utc_nanos()
+            file_times = file_times[file_times != missing]
+            time_min.append(file_times.min() if len(file_times) else np.iinfo('int64').max)
+            time_max.append(file_times.max() if len(file_times) else missing)
+        if len(time_min) != len(self.offsets):
+            _LOGGER.warning("The rows of {} are not lines, its rows can not be found by time".format(self.path))
+            return False
+        self.time_key = key
+        self.time_min, self.time_max = np.array(time_min, dtype='int64'), np.array(time_max, dtype='int64')
+        _LOGGER.info("Indexed the times of {} in {:.3f} sec".format(self.path, time.perf_counter() - start))
+        self.save()
+        return True
+
+    def time_range(self, start, end):
+        """ Returns the rows between which the rows timed from start to end lie, from the times of the blocks.
+        Args:
+            start: Earliest time in ns since the epoch UTC, None for no bound
+            end: Time after the latest one, None for no bound
+        Returns:
+            first row of the first block holding such rows, row after the last block holding such rows
+        """
+        first_block = 0
+        if start is not None:
+            late = self.time_max >= start
+            first_block = int(np.argmax(late)) if late.any() else len(self.offsets)
+        stop_block = len(self.offsets)
+        if end is not None:
+            early = np.flatnonzero(self.time_min < end)
+            stop_block = int(early[-1]) + 1 if len(early) else 0
+        first_row = min(first_block * self.STRIDE, self.n_rows)
+        return first_row, max(min(stop_block * self.STRIDE, self.n_rows), first_row)
+
+
+def _read_from(path, offset, chunksize, **options):
+    """ Iterates over the chunks of a csv file read by pandas from a byte offset on, there is no header """
+    with open(path, 'rb') as fd:
+        fd.seek(offset)
+        yield from pd.read_csv(fd, header=None, chunksize=chunksize, **options)
+
+
+def _skip_rows(chunks, rows):
+    """ Iterates over chunks but the first rows """
+    for chunk in chunks:
+        if rows >= len(chunk):
+            rows -= len(chunk)
+            continue
+        if rows:
+            chunk = chunk.iloc[rows:].reset_index(drop=True)
+            rows = 0
+        yield chunk
+
+
+class Checkpoint:
+    """ Playback position saved into the data directory, so that the playback resumes there after a restart of
+    the service or a reconfiguration.
+
+    The position is the one after the last chunk whose readings have been handed over: returned by plugin_poll,
+    or passed to the ingest callback in async mode. It holds the identity of the file (path, size and
+    modification time), the no. of rows played, and the clock of the 'use csv sample delta' timestamps. It is
+    saved at most once per interval, and on shutdown.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path, interval):
+        self.path = path
+        self.interval = interval
+        self.position = None  # position to save
+        self.dirty = False
+        self.saved_at = time.monotonic()
+
+    @classmethod
+    def from_handle(cls, handle):
+        """ Returns the checkpoint of the asset of handle, None if checkpoints are off """
+        interval = int(handle['checkpointInterval']['value'])
+        if interval <= 0:
+            return None
+        name = re.sub(r'[^\w.-]', '_', handle['assetName']['value'])
+        return cls(os.path.join(_FLEDGE_DATA, 'csvplayback', 'checkpoints', name + '.json'), interval)
+
+    def load(self):
+        """ Returns the saved position, None if there is none """
+        try:
+            with open(self.path) as fd:
+                position = json.load(fd)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as ex:
+            _LOGGER.warning("The checkpoint {} could not be read: {}".format(self.path, ex))
+            return None
+        return position if position.get('version') == self.VERSION else None
+
+    def commit(self, position):
+        """ Records the position reached, saved if the interval has elapsed """
+        self.position = position
+        self.dirty = True
+        if time.monotonic() - self.saved_at >= self.interval:
+            self.save()
+
+    def save(self):
+        """ Saves the last position recorded, if not saved yet """
+        if not self.dirty:
+            return
+        self.dirty = False
+        self.saved_at = time.monotonic()
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path + '.tmp', 'w') as fd:
+                json.dump(dict(self.position, version=self.VERSION), fd)
+            os.replace(self.path + '.tmp', self.path)
+        except OSError as ex:
+            _LOGGER.warning("The checkpoint {} could not be saved: {}".format(self.path, ex))
+
+
+class ColumnarSidecar:
+    """ Iterates over chunks of a csv file loaded from its binary columnar sidecar.
+
+    process_csv_data.py --sidecar writes <file>.npcols next to the csv file: for every chunk of the csv file,
+    one .npy record per column holding the values as typed when pandas reads the csv file; text is stored
+    as fixed width unicode, missing text as ''. <file>.npcols.json holds the column names, the number of chunks
+    and the size and modification time of the csv file the sidecar matches.
+    """
+
+    def __init__(self, path, schema, chunksize):
+        self.path = path
+        self.names = schema['columns']
+        self.n_chunks = schema['chunks']
+        self._chunks = _rechunk(self._read(), chunksize)
+
+    @classmethod
+    def find(cls, csv_path, chunksize):
+        """ Returns the sidecar of the csv file, None if there is none or it does not match the csv file """
+        try:
+            with open(csv_path + _SIDECAR_SCHEMA_SUFFIX) as fd:
+                schema = json.load(fd)
+        except (OSError, ValueError):
+            return None
+        source = schema.get('source', {})
+        if schema.get('version') != _SIDECAR_VERSION or \
+                _file_identity(csv_path) != (source.get('size'), source.get('mtime_ns')) or \
+                not os.path.exists(csv_path + _SIDECAR_SUFFIX):
+            _LOGGER.info("Ignoring the sidecar of {} as it does not match the csv file.".format(csv_path))
+            return None
+        _LOGGER.info("Playing {} from its binary columnar sidecar.".format(csv_path))
+        return cls(csv_path + _SIDECAR_SUFFIX, schema, chunksize)
+
+    def _read(self):
+        with open(self.path, 'rb') as fd:
+            for _ in range(self.n_chunks):
+                columns = []
+                for _ in self.names:
+                    values = np.load(fd, allow_pickle=False)
+                    if values.dtype.kind == 'U':
+                        values = values.astype(object)
+                        values[values == ''] = np.nan
+                    columns.append(values)
+                chunk = pd.DataFrame(dict(enumerate(columns)), copy=False)
+                chunk.columns = self.names
+                yield chunk
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._chunks)
+
+
+def _rechunk(frames, chunksize):
+    """ Regroups the rows of an iterator over DataFrames into DataFrames of chunksize rows, but the last """
+    pending = None
+    for frame in frames:
+        pending = frame if pending is None else pd.concat([pending, frame], ignore_index=True)
+        while pending is not None and len(pending) >= chunksize:
+            yield pending.iloc[:chunksize]
+            pending = pending.iloc[chunksize:] if len(pending) > chunksize else None
+    if pending is not None:
+        yield pending
+
+
+class ReplayCache:
+    """ Keeps the parsed chunks of a file which is played in a loop, so that the next loops replay them
+    without parsing the csv file.
+
+    Chunks are kept in memory as long as they fit the byte budget. Beyond it, they are moved to a binary
+    columnar spill file in the data directory, where every chunk is stored as one .npy record per column.
+    Replayed chunks are the recorded objects, they must not be modified in place.
+    """
+
+    def __init__(self, path, budget):
+        """
+        Args:
+            path: The csv file being recorded
+            budget: Bytes of memory the chunks may take before they are spilled to disk
+        """
+        self.path = path
+        self.budget = budget
+        self.identity = _file_identity(path)
+        self.names = None
+        self.chunks = []
+        self.size = 0
+        self.n_chunks = 0
+        self.spill = None
+        self.complete = False
+
+    def replayable(self, path):
+        """ Whether the whole file has been recorded, and it has not changed since """
+        return self.complete and path == self.path and _file_identity(path) == self.identity
+
+    def record(self, chunks):
+        for chunk in chunks:
+            self.add(chunk)
+            yield chunk
+        self.complete = True
+        _LOGGER.info("Recorded {} chunks of {} for replay {}.".format(
+            self.n_chunks, self.path, "in memory" if self.spill is None else "in a spill file"))
+
+    def add(self, chunk):
+        if self.names is None:
+            self.names = list(chunk.columns)
+        self.n_chunks += 1
+        if self.spill is not None:
+            self._write(chunk)
+            return
+        self.chunks.append(chunk)
+        self.size += int(chunk.memory_usage(index=False, deep=True).sum())
+        if self.size > self.budget:
+            _LOGGER.info("Parsed rows of {} exceed {} bytes, moving them to a spill file.".format(
+                self.path, self.budget))
+            self.spill = tempfile.TemporaryFile(dir=_storage_dir())
+            for recorded in self.chunks:
+                self._write(recorded)
+            self.chunks = []
+
+    def _write(self, chunk):
+        for i in range(chunk.shape[1]):
+            np.save(self.spill, chunk.iloc[:, i].to_numpy(), allow_pickle=True)
+
+    def replay(self):
+        if self.spill is None:
+            yield from self.chunks
+            return
+        self.spill.seek(0)
+        for _ in range(self.n_chunks):
+            columns = [np.load(self.spill, allow_pickle=True) for _ in self.names]
+            chunk = pd.DataFrame(dict(enumerate(columns)), copy=False)
+            chunk.columns = self.names
+            yield chunk
+
+    def close(self):
+        self.chunks = []
+        if self.spill is not None:
+            self.spill.close()
+            self.spill = None
+
+
+def _file_identity(path):
+    """ Size and modification time, telling whether a file has changed """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _storage_dir():
+    """ Directory for temporary binary files; the data directory unless it is not writable """
+    return _FLEDGE_DATA if os.access(_FLEDGE_DATA, os.W_OK) else None
+
+
+class NaNRepair:
+    """ Fills the missing values of the numeric columns of a file while it is played, chunk by chunk.
+
+    Text columns whose values are all numbers or blanks are filled as numeric columns. The rows whose fill
+    depends on a value not read yet are held back until the next chunk, up to max_hold rows, and the rows the
+    fills are anchored on are carried over to the next chunk, so that the values filled do not depend on where
+    the file is cut into chunks. As pandas with limit_direction='both', interpolation fills the rows before the
+    first value and after the last one of a column with that value.
+    """
+
+    def __init__(self, method, window, max_hold, skip=()):
+        """
+        Args:
+            method: linear, nearest, rolling mean or rolling median
+            window: Number of rows of the rolling fills
+            max_hold: Rows which may be held back, waiting for a value
+            skip: Columns not to fill
+        """
+        self.method = method
+        self.window = window
+        self.max_hold = max_hold
+        self.skip = set(skip)
+        self.text_columns = set()  # text columns which hold something else than numbers
+        self.holding_over = False  # whether the last gap was longer than max_hold
+
+    def stream(self, chunks):
+        """ Repairs the chunks of a file
+        Args:
+            chunks: iterator over the chunks of the file
+        Returns:
+            iterator over the chunks filled, the rows held back come with the next chunk or at the end of the file
+        """
+        context = pending = None
+        for chunk in chunks:
+            if not len(chunk):
+                continue
+            out, context, pending = self.repair(context, pending, chunk, False)
+            if len(out):
+                yield out
+        if pending is not None and len(pending):
+            out, _, _ = self.repair(context, pending, None, True)
+            if len(out):
+                yield out
+
+    def numeric(self, frame):
+        """ Returns the columns of a frame to fill, as float arrays by name """
+        columns = {}
+        for name in frame.columns:
+            if name in self.skip or name in self.text_columns:
+                continue
+            values = frame[name]
+            if values.dtype.kind == 'f':
+                columns[name] = values.to_numpy()
+            elif values.dtype == object:
+                blank = values.isnull().to_numpy() | values.astype(str).str.isspace().to_numpy()
+                numbers = pd.to_numeric(values.where(~blank), errors='coerce').to_numpy(dtype='float64')
+                if (np.isnan(numbers) != blank).any():
+                    self.text_columns.add(name)
+                else:
+                    columns[name] = numbers
+        return columns
+
+    def repair(self, context, pending, chunk, last):
+        """ Fills the rows of a chunk, with the rows of the previous chunks it depends on
+        Args:
+            context: Rows already given, the next fills are anchored on, or None
+            pending: Rows held back, or None
+            chunk: DataFrame read from the csv file, None at the end of the file
+            last: Whether the file ends
+        Returns:
+            tuple of the rows filled, the context and the rows held back for the next chunk
+        """
+        frames = [frame for frame in (context, pending, chunk) if frame is not None and len(frame)]
+        frame = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0].reset_index(drop=True)
+        n_rows = len(frame)
+        start = 0 if context is None else len(context)
+        columns = self.numeric(frame)
+        rolling = self.method in ['rolling mean', 'rolling median']
+
+        cut = n_rows
+        if columns and not rolling and not last:
+            valid = ~np.isnan(np.column_stack(list(columns.values())))
+            last_valid = n_rows - 1 - np.argmax(valid[::-1], axis=0)
+            last_valid[~valid.any(axis=0)] = -1
+            cut = max(int(last_valid.min()) + 1, start)
+            if n_rows - cut > self.max_hold:
+                if not self.holding_over:
+                    _LOGGER.warning("No value for more than {} rows, the missing values are filled with the last "
+                                    "ones instead of {}".format(self.max_hold, self.method))
+                self.holding_over = True
+                cut = n_rows
             else:
-                reading = {
-                    'asset': self.asset_name,
-                    'timestamp': modified_timestamp,
-                    'readings': row_values
-                }
-
-            if self.is_burst:
-                readings.append(reading)
+                self.holding_over = False
+
+        out = frame.iloc[start:cut].copy()
+        for name, values in columns.items():
+            missing = np.isnan(values)
+            if not missing[start:cut].any():
+                if out[name].dtype == object:
+                    out[name] = values[start:cut]
+                continue
+            if rolling:
+                series = pd.Series(values).rolling(self.window, min_periods=1)
+                filled = np.where(missing, (series.mean() if self.method == 'rolling mean' else series.median()),
+                                  values)
             else:
-                # continuous mode - return readings as you get them
-                # xxx - calculate error from desired vs actual return rate
-                yield reading
+                filled = values.copy()
+                known = np.flatnonzero(~missing)
+                if len(known):
+                    holes = np.flatnonzero(missing)
+                    if self.method == 'linear':
+                        filled[holes] = np.interp(holes, known, values[known])
+                    else:
+                        right = np.searchsorted(known, holes).clip(max=len(known) - 1)
+                        left = (right - 1).clip(min=0)
+                        nearest = np.where(np.abs(holes - known[left]) <= np.abs(known[right] - holes), left, right)
+                        filled[holes] = values[known[nearest]]
+            out[name] = filled[start:cut]
+
+        # the fills of the next rows are anchored on the last value of every column
+        if rolling:
+            first = max(cut - self.window + 1, 0)
+        elif columns and cut:
+            valid = ~np.isnan(np.column_stack(list(columns.values()))[:cut])
+            anchors = cut - 1 - np.argmax(valid[::-1], axis=0)[valid.any(axis=0)]
+            first = int(anchors.min()) if len(anchors) else cut
+        else:
+            first = cut
+        first = max(first, cut - self.max_hold)
+        context = frame.iloc[first:cut]
+        if cut > start and not rolling:
+            # beyond max_hold, a column is anchored on the last value given
+            lost = [name for name, values in columns.items() if np.isnan(values[first:cut]).all()]
+            if lost:
+                context = context.copy()
+                for name in lost:
+                    context.loc[context.index[-1], name] = out[name].iloc[-1]
+        return out, context, frame.iloc[cut:]
+
+
+class PlaybackMetrics:
+    """ Throughput and latency of the playback, shared by the threads and the sources of the plugin.
+
+    The counters are summed over a metrics interval. At the end of the interval they are logged as one line of
+    JSON and, if a stats asset is configured, returned as a reading of that asset, to be ingested next to the data.
+    """
 
-        if readings != []:
-            # burst mode - return all at once
-            yield readings
+    COUNTERS = ('rows', 'chunks', 'parse', 'conversions', 'readings', 'convert', 'emitted', 'ingest_calls',
+                'ingest', 'file_switches', 'file_switch_gap')
+
+    def __init__(self, interval, stats_asset):
+        self.interval = interval
+        self.stats_asset = stats_asset
+        self.lock = Lock()
+        self.counters = dict.fromkeys(self.COUNTERS, 0)
+        self.max_file_switch_gap = 0.0
+        self.file_ended = {}  # reader -> end of its last file, while it switches to the next one
+        self.window_start = time.monotonic()
+        self.profiler = None  # PlaybackProfiler, if profiling is on
+
+    @classmethod
+    def from_handle(cls, handle):
+        return cls(int(handle['metricsInterval']['value']), handle['statsAsset']['value'].strip())
+
+    def add(self, **values):
+        """ Adds values to the counters of the current interval """
+        with self.lock:
+            for name, value in values.items():
+                self.counters[name] += value
+
+    def enter(self, stage):
+        """ Marks the start of a stage of the hot path for the profiler, if any.
+        Returns:
+            the token to leave the stage with
+        """
+        profiler = self.profiler
+        return profiler.enter(stage) if profiler is not None else None
 
-        return None
+    @staticmethod
+    def leave(token):
+        """ Marks the end of the stage entered with token """
+        if token is not None:
+            token[0].leave(token)
+
+    def chunks(self, chunks, owner):
+        """ Times the parsing of the chunks of a file, and the gap since the end of the previous file of owner.
+
+        Args:
+            chunks: iterator over the chunks of the file
+            owner: the CSVReader playing the file
+        Returns:
+            iterator over the same chunks
+        """
+        chunks = iter(chunks)
+        while True:
+            start = time.perf_counter()
+            token = self.enter('parse')
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                self.file_ended[owner] = time.perf_counter()
+                return
+            finally:
+                self.leave(token)
+            end = time.perf_counter()
+            ended = self.file_ended.pop(owner, None)
+            with self.lock:
+                self.counters['rows'] += len(chunk)
+                self.counters['chunks'] += 1
+                self.counters['parse'] += end - start
+                if ended is not None:
+                    self.counters['file_switches'] += 1
+                    self.counters['file_switch_gap'] += end - ended
+                    self.max_file_switch_gap = max(self.max_file_switch_gap, end - ended)
+            yield chunk
+
+    def idle(self, owner):
+        """ owner has no next file to play; the wait for one is not a file switch gap """
+        self.file_ended.pop(owner, None)
+
+    def report(self, scheduler, queue_depth=None):
+        """ Logs the metrics of the interval once it has elapsed and starts the next one.
+
+        Args:
+            scheduler: PacingScheduler of the playback, for the pacing lag
+            queue_depth: readings queue depth in chunks, None in poll mode
+        Returns:
+            the stats reading, None if the interval has not elapsed or there is no stats asset
+        """
+        if self.interval <= 0:
+            return None
+        now = time.monotonic()
+        if now - self.window_start < self.interval:
+            return None
+        with self.lock:
+            counters, self.counters = self.counters, dict.fromkeys(self.COUNTERS, 0)
+            max_file_switch_gap, self.max_file_switch_gap = self.max_file_switch_gap, 0.0
+            elapsed, self.window_start = now - self.window_start, now
+
+        def per(total, count, scale=1000.0):
+            return round(total * scale / count, 3) if count else 0.0
+
+        stats = {
+            'rowsParsedPerSec': round(counters['rows'] / elapsed, 1),
+            'readingsEmittedPerSec': round(counters['emitted'] / elapsed, 1),
+            'parseMsPerChunk': per(counters['parse'], counters['chunks']),
+            'convertMsPerChunk': per(counters['convert'], counters['conversions']),
+            'convertUsPerReading': per(counters['convert'], counters['readings'], 1e6),
+            'pacingLagSec': round(scheduler.owed() / scheduler.rate, 3) if scheduler.start is not None else 0.0,
+            'fileSwitches': counters['file_switches'],
+            'fileSwitchGapMs': per(counters['file_switch_gap'], counters['file_switches']),
+            'fileSwitchGapMaxMs': round(max_file_switch_gap * 1000, 3),
+        }
+        if queue_depth is not None:
+            # async mode, readings are ingested by the consumer thread
+            stats['ingestMsPerCall'] = per(counters['ingest'], counters['ingest_calls'])
+            stats['queueDepth'] = queue_depth
+        _LOGGER.info("Playback metrics {}".format(json.dumps(stats)))
+        if not self.stats_asset:
+            return None
+        return {'asset': self.stats_asset, 'timestamp': utils.local_timestamp(), 'readings': stats}
+
+
+class PlaybackProfiler:
+    """ Opt-in profiler of the stages of the hot path: parse, convert and ingest.
+
+    The threads mark the stages they run through with enter() and leave(). Every interval, aligned on the clock,
+    a dump is written into the directory, and the dumps beyond the number to keep are deleted, oldest first:
+
+    - profile-<time>.json: the seconds spent in and the calls of every stage, and their share of the interval,
+    - sampling: profile-<time>.collapsed: the stacks of the threads in a stage, sampled every SAMPLE_PERIOD. One
+      line per stack, the stage as root frame, followed by its number of samples, as read by flamegraph.pl or
+      speedscope,
+    - cProfile: profile-<time>-<thread>.prof: the profile of every thread, as read by pstats or snakeviz.
+    """
+
+    SAMPLE_PERIOD = 0.01  # seconds between two samples of the stacks
+    PREFIX = 'profile-'
+    STAMP = '%Y%m%d-%H%M%S'
+
+    def __init__(self, method, directory, interval, keep):
+        self.method = method
+        self.directory = directory
+        self.interval = interval
+        self.keep = keep
+        self.lock = Lock()
+        self.active = {}  # thread ident -> stage the thread is in
+        self.times = {}  # stage -> [seconds, calls] of the current interval
+        self.samples = {}  # collapsed stack -> samples of the current interval
+        self.profiles = {}  # thread ident -> [cProfile.Profile, interval it started in, thread name]
+        self.period = self.period_of(time.time())
+        self.stopped = Event()
+        self.thread = Thread(target=self.run, name='CSVProfiler', daemon=True)
+        self.thread.start()
+
+    @classmethod
+    def from_handle(cls, handle):
+        """ Returns the profiler configured by handle, None if profiling is off """
+        method = handle['profiling']['value']
+        if method == 'off':
+            return None
+        directory = os.path.join(_FLEDGE_DATA, 'csvplayback', 'profiles')
+        try:
+            os.makedirs(directory, exist_ok=True)
+        except OSError as ex:
+            _LOGGER.error("Profiling is off, {} can not be created: {}".format(directory, ex))
+            return None
+        _LOGGER.info("Profiling the playback ({}) into {}".format(method, directory))
+        return cls(method, directory, int(handle['profileInterval']['value']), int(handle['profileDumps']['value']))
+
+    def period_of(self, now):
+        return int(now // self.interval)
+
+    def path(self, period, suffix):
+        stamp = time.strftime(self.STAMP, time.localtime(period * self.interval))
+        return os.path.join(self.directory, self.PREFIX + stamp + suffix)
+
+    def enter(self, stage):
+        """ The calling thread enters stage """
+        ident = get_ident()
+        self.active[ident] = stage
+        profile = None
+        if self.method == 'cProfile':
+            entry = self.profiles.get(ident)
+            if entry is None:
+                import cProfile
+                entry = self.profiles[ident] = [cProfile.Profile(), self.period_of(time.time()),
+                                                current_thread().name]
+            profile = entry[0]
+            try:
+                profile.enable()
+            except ValueError:
+                # another profiler is active, like the one of another thread where one profiles all the threads
+                profile = None
+        return self, stage, ident, profile, time.perf_counter()
+
+    def leave(self, token):
+        """ The calling thread leaves the stage of token """
+        _, stage, ident, profile, start = token
+        elapsed = time.perf_counter() - start
+        if profile is not None:
+            profile.disable()
+        self.active.pop(ident, None)
+        with self.lock:
+            totals = self.times.setdefault(stage, [0.0, 0])
+            totals[0] += elapsed
+            totals[1] += 1
+        if profile is not None:
+            entry = self.profiles[ident]
+            if self.stopped.is_set() or self.period_of(time.time()) != entry[1]:
+                self.dump_profile(ident, entry)
+
+    def dump_profile(self, ident, entry):
+        """ Writes the cProfile profile of a thread, which is not in a stage, and starts the next one """
+        profile, period, name = entry
+        del self.profiles[ident]
+        try:
+            profile.dump_stats(self.path(period, '-{}.prof'.format(name)))
+        except (OSError, TypeError) as ex:
+            # TypeError: nothing has been profiled
+            _LOGGER.debug("The profile of {} is not written: {}".format(name, ex))
+
+    def run(self):
+        period = self.SAMPLE_PERIOD if self.method == 'sampling' else 0.5
+        while not self.stopped.wait(period):
+            if self.method == 'sampling':
+                self.sample()
+            if self.period_of(time.time()) != self.period:
+                self.dump()
+        self.dump()
+
+    def sample(self):
+        """ Counts the stacks of the threads in a stage """
+        frames = sys._current_frames()
+        for ident, stage in dict(self.active).items():
+            frame = frames.get(ident)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('{}:{}'.format(os.path.basename(code.co_filename), code.co_name))
+                frame = frame.f_back
+            stack.append(stage)
+            key = ';'.join(reversed(stack))
+            self.samples[key] = self.samples.get(key, 0) + 1
+
+    def dump(self):
+        """ Writes the stage breakdown and the samples of the interval, deletes the oldest dumps """
+        period = self.period
+        self.period = self.period_of(time.time())
+        with self.lock:
+            times, self.times = self.times, {}
+        samples, self.samples = self.samples, {}
+        if not times:
+            return
+        seconds = float(self.interval * max(self.period - period, 1))
+        breakdown = {
+            'start': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(period * self.interval)),
+            'seconds': seconds,
+            'method': self.method,
+            'stages': {stage: {'seconds': round(total, 6), 'calls': calls, 'share': round(total / seconds, 4)}
+                       for stage, (total, calls) in times.items()},
+        }
+        try:
+            with open(self.path(period, '.json'), 'w') as fd:
+                json.dump(breakdown, fd, indent=2)
+            if samples:
+                with open(self.path(period, '.collapsed'), 'w') as fd:
+                    fd.writelines('{} {}\n'.format(stack, count) for stack, count in samples.items())
+            self.rotate()
+        except OSError as ex:
+            _LOGGER.warning("The profile dump could not be written: {}".format(ex))
+
+    def rotate(self):
+        """ Keeps the files of the last dumps only """
+        names = [name for name in os.listdir(self.directory) if name.startswith(self.PREFIX)]
+        length = len(self.PREFIX) + len(time.strftime(self.STAMP))
+        old = sorted({name[:length] for name in names})[:-self.keep]
+        for name in names:
+            if name[:length] in old:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+    def close(self):
+        """ Writes the last dump. The profiles of the threads still in a stage are written when they leave it """
+        self.stopped.set()
+        _join(self.thread)
+        for ident, entry in list(self.profiles.items()):
+            if ident not in self.active:
+                self.dump_profile(ident, entry)
+
+
+class PacingScheduler:
+    """ Paces readings against a single monotonic schedule anchored at the start of playback.
+
+    Reading n is due at start + n / rate. Being late, e.g. after a stall, is made good by ingesting the late
+    readings without waiting, but by no more than max_catch_up seconds worth of readings; the schedule is
+    moved forward by the rest.
+    """
+
+    REPORT_INTERVAL = 60  # seconds between two reports of achieved vs requested rate
+
+    def __init__(self, rate, batch_size, max_catch_up):
+        self.rate = float(rate)
+        self.batch_size = max(1, int(batch_size))
+        self.max_lag = int(max_catch_up * self.rate)
+        self.origin = None  # the actual start of playback
+        self.start = None  # start of the schedule, moves forward when readings are not caught up
+        self.emitted = 0
+        self.last_report = None
+
+    @classmethod
+    def from_handle(cls, handle):
+        chunk_size = int(handle['chunkSize']['value'])
+        max_catch_up = int(handle['maxCatchUp']['value']) / 1000.0
+        if handle['ingestMode']['value'] == 'burst':
+            # one chunk is a burst, ingested every burst interval
+            burst_interval = int(handle['burstInterval']['value']) / 1000.0
+            if handle['arrayDatapoints']['value'] == 'true':
+                # every burst is one reading
+                return cls(1 / burst_interval, 1, max_catch_up)
+            return cls(chunk_size / burst_interval, chunk_size, max_catch_up)
+        # one chunk is a second's worth of readings
+        pack_window = int(handle['packWindow']['value'])
+        if pack_window > 0:
+            # every window of rows of a chunk is one reading
+            return cls(-(-chunk_size // pack_window), int(handle['microBatchSize']['value']) // pack_window,
+                       max_catch_up)
+        return cls(chunk_size, int(handle['microBatchSize']['value']), max_catch_up)
+
+    def _lag(self, now):
+        """ Number of readings which are due but not emitted yet at time now """
+        if self.start is None:
+            self.origin = self.start = self.last_report = now
+        lag = int((now - self.start) * self.rate) - self.emitted
+        if lag > self.max_lag + self.batch_size:
+            # Stalled for longer than we may catch up; forgive the rest
+            forgiven = lag - self.max_lag - self.batch_size
+            self.start += forgiven / self.rate
+            lag -= forgiven
+        return lag
+
+    def owed(self):
+        """ Returns the number of readings due now, including the ones to catch up """
+        return max(self._lag(time.monotonic()), 0)
+
+    def wait(self, event):
+        """ Blocks until the next reading is due.
+
+        Args:
+            event: Event which interrupts the wait when set
+        Returns:
+            True if the event has been set
+        """
+        now = time.monotonic()
+        self._lag(now)
+        delay = self.start + self.emitted / self.rate - now
+        if delay > 0:
+            return event.wait(timeout=delay)
+        return event.is_set()
+
+    def done(self, n_readings):
+        """ Records that n_readings have been emitted """
+        self.emitted += n_readings
+        now = time.monotonic()
+        if now - self.last_report >= self.REPORT_INTERVAL:
+            self.last_report = now
+            _LOGGER.info("Requested rate {:.1f} readings/sec, achieved {:.1f} readings/sec".format(
+                self.rate, self.achieved_rate()))
+
+    def achieved_rate(self):
+        """ Returns readings/sec emitted since the start of playback """
+        if self.origin is None:
+            return 0.0
+        elapsed = time.monotonic() - self.origin
+        return self.emitted / elapsed if elapsed > 0 else 0.0
+
+
+class SourceSet:
+    """ Plays several csv sources at once as one stream of readings merged in timestamp order, through a k-way
+    merge on a heap of the next reading of every source. Every source has its own CSVReader; the next chunk of
+    every source is parsed and converted ahead in a thread pool while the current chunks are merged, so that at
+    most two chunks per source are held in memory.
+
+    The readings of every source keep their own asset, or, with an as-of join, the rows of the first source are
+    fused with the latest values of the other sources into readings of the asset of the plugin.
+    """
+
+    def __init__(self, handle, source_handles, metrics):
+        """
+        Args:
+            handle: handle of the plugin
+            source_handles: one handle per source
+            metrics: PlaybackMetrics shared by the sources
+        """
+        self.metrics = metrics
+        self.readers = [CSVReader(source_handle, metrics) for source_handle in source_handles]
+        n_sources = len(self.readers)
+        self.pool = ThreadPoolExecutor(max_workers=min(n_sources, os.cpu_count() or 1),
+                                       thread_name_prefix='CSVSource')
+        self.pending = [None] * n_sources  # future of the next chunk of every source
+        self.played = [0] * n_sources  # readings converted per source, for the readings without file time
+        self.passes = [0] * n_sources  # pass of the file of every source the keys are shifted for
+        self.shifts = [0] * n_sources  # added to the file times of every source, so that replays go on in time
+        self.last_keys = [None] * n_sources  # (last key, last step) of every source
+        self.origin = time.time_ns()
+        self.heads = [None] * n_sources  # [keys, readings, position] of the chunk being merged
+        self.heap = []  # (key of the next reading, rank, source) of the sources having a chunk to merge
+        self.merging = set()  # the sources in the heap
+
+        self.as_of = handle['sourcesJoin']['value'] == 'as-of'
+        self.asset_name = handle['assetName']['value']
+        self.tolerance = int(handle['joinTolerance']['value']) * 1000000
+        self.latest = [None] * n_sources  # as-of join: (key, datapoints) of the last reading of the other sources
+        # At equal timestamps the first source goes last, so that it is joined with the values of the others
+        # at that very time.
+        self.ranks = [n_sources if self.as_of and i == 0 else i for i in range(n_sources)]
+
+        self.rates = [PacingScheduler.from_handle(source).rate for source in source_handles]
+        chunk_sizes = [int(source['chunkSize']['value']) for source in source_handles]
+        if self.as_of:
+            # only the rows of the first source become readings
+            rate = self.rates[0]
+            self.chunk_size = chunk_sizes[0]
+        else:
+            # a burst of every source per burst interval, or the readings per second of all sources together
+            rate = sum(self.rates)
+            self.chunk_size = sum(chunk_sizes)
+        if handle['ingestMode']['value'] == 'burst':
+            batch_size = self.chunk_size
+        else:
+            batch_size = int(handle['microBatchSize']['value'])
+        self.scheduler = PacingScheduler(rate, batch_size, int(handle['maxCatchUp']['value']) / 1000.0)
+        _LOGGER.info("Playing {} sources: {}{}".format(n_sources, ', '.join(r.asset_name for r in self.readers),
+                                                      ', as-of joined' if self.as_of else ''))
+
+    def next_readings(self, i):
+        """ Converts the next chunk of source i, runs in the pool.
+        Readings timed from the file are merged on their timestamps. The others are given their timestamps when
+        converted, possibly ahead of time, so they are merged on the time they are due as per the sample rate
+        of their source instead.
+        Returns:
+            tuple of the keys and readings of the chunk, possibly empty; None if the source has no file to play
+        """
+        csv_reader = self.readers[i]
+        if not csv_reader.current_csv_file:
+            return None
+        chunk = csv_reader.next_chunk()
+        if chunk is None:
+            return [], []
+        start = time.perf_counter()
+        token = self.metrics.enter('convert')
+        try:
+            chunk, timestamps, keys = csv_reader.chunk_timestamps(chunk, keys=True)
+            if chunk is None:
+                return [], []
+            if keys is None:
+                due = self.played[i] + np.arange(len(timestamps), dtype='int64')
+                keys = self.origin + (due * (1e9 / self.rates[i])).astype('int64')
+            else:
+                keys = self.shifted(i, keys)
+            self.played[i] += len(timestamps)
+            readings = csv_reader.build_readings(chunk, timestamps)
+        finally:
+            self.metrics.leave(token)
+        self.metrics.add(conversions=1, readings=len(readings), convert=time.perf_counter() - start)
+        return keys, readings
+
+    def shifted(self, i, keys):
+        """ Shifts the file times of source i so that they keep increasing from a pass of its file to the next.
+        A pass going back in time, like a replay of the file, goes on one step after the last key of the source,
+        so that it is merged after the readings of the other sources played meanwhile.
+        Args:
+            i: The source
+            keys: int64 array of the file times of a chunk
+        Returns:
+            the keys to merge the chunk on
+        """
+        passes = self.readers[i].passes
+        if passes != self.passes[i]:
+            self.passes[i] = passes
+            if self.last_keys[i] is not None and len(keys):
+                last_key, step = self.last_keys[i]
+                if int(keys[0]) + self.shifts[i] <= last_key:
+                    self.shifts[i] = last_key + step - int(keys[0])
+        keys = keys + self.shifts[i]
+        if len(keys):
+            step = int(keys[-1] - keys[-2]) if len(keys) > 1 else 0
+            if step <= 0:
+                step = self.last_keys[i][1] if self.last_keys[i] is not None else int(1e9 / self.rates[i])
+            self.last_keys[i] = (int(keys[-1]), step)
+        return keys
+
+    def head(self, i):
+        """ Returns the chunk of source i being merged, waiting for it if it is being prepared.
+        None if the source has no file to play right now.
+        """
+        while self.heads[i] is None:
+            if self.pending[i] is None:
+                self.pending[i] = self.pool.submit(self.next_readings, i)
+            result = self.pending[i].result()
+            self.pending[i] = None
+            if result is None:
+                return None
+            keys, readings = result
+            if readings:
+                self.heads[i] = [keys, readings, 0]
+                # prepare the next chunk while this one is merged
+                self.pending[i] = self.pool.submit(self.next_readings, i)
+        return self.heads[i]
+
+    def push(self, i):
+        """ Puts source i into the heap, unless it has no file to play right now """
+        head = self.head(i)
+        if head is None:
+            return
+        keys, _, position = head
+        heapq.heappush(self.heap, (int(keys[position]), self.ranks[i], i))
+        self.merging.add(i)
+
+    def take(self, count):
+        """ Returns up to count readings of all sources, merged in timestamp order.
+        The order of the readings of every source is kept.
+        """
+        for i in range(len(self.readers)):
+            if i not in self.merging:
+                self.push(i)
+
+        merged = []
+        idle = 0  # merges in a row which emitted nothing
+        while len(merged) < count and self.heap and not wait_event.is_set():
+            if idle > len(self.readers):
+                # a full pass over the heap emitted nothing, the caller polls again
+                break
+            if self.as_of and 0 not in self.merging:
+                # nothing to join the other sources to
+                break
+            _, _, i = heapq.heappop(self.heap)
+            self.merging.discard(i)
+            keys, readings, position = self.heads[i]
+            emits = not self.as_of or i == 0
+
+            # the source goes on up to the next reading of the others
+            end = len(readings)
+            if self.heap:
+                side = 'left' if self.as_of and i == 0 else 'right'
+                end = position + max(1, int(np.searchsorted(keys[position:], self.heap[0][0], side=side)))
+            if emits:
+                end = min(end, position + count - len(merged))
+
+            if not self.as_of:
+                merged.extend(readings[position:end])
+            elif i == 0:
+                merged.extend(self.join(readings[position:end], keys[position:end]))
+            else:
+                self.latest[i] = (int(keys[end - 1]), readings[end - 1]['readings'])
+            idle = 0 if emits else idle + 1
+
+            if end == len(readings):
+                self.heads[i] = None
+            else:
+                self.heads[i][2] = end
+            self.push(i)
+        return merged
 
+    def join(self, readings, keys):
+        """ As-of join of rows of the first source with the latest values of the other sources
+
+        Args:
+            readings: readings of the first source, none of the other sources having a reading in between
+            keys: their timestamps
+        Returns:
+            list of readings of the asset of the plugin, datapoints of the first source first
+        """
+        n_readings = len(readings)
+        others = []  # (no. of readings the values are fresh for, datapoints)
+        for latest in self.latest:
+            if latest is None:
+                continue
+            key, datapoints = latest
+            fresh = n_readings
+            if self.tolerance:
+                fresh = int(np.searchsorted(keys, key + self.tolerance, side='right'))
+            if fresh:
+                others.append((fresh, datapoints))
+
+        asset = self.asset_name
+        joined = []
+        for k, reading in enumerate(readings):
+            datapoints = dict(reading['readings'])
+            for fresh, values in others:
+                if k < fresh:
+                    for name, value in values.items():
+                        # the first source wins over the others for a datapoint name they share
+                        datapoints.setdefault(name, value)
+            joined.append({'asset': asset, 'timestamp': reading['timestamp'], 'readings': datapoints})
+        return joined
+
+    def poll(self, event):
+        """ Returns the readings which are due as per the playback schedule, at least one batch.
+        Args:
+            event: Event which interrupts the wait for the readings to be due
+        """
+        if self.scheduler.wait(event):
+            return None
+        readings = self.take(max(self.scheduler.owed(), self.scheduler.batch_size))
+        self.scheduler.done(len(readings))
+        return readings if readings else None
 
-MAX_QUEUE_CHUNK_CAPACITY = 3
+    def close(self):
+        self.pool.shutdown(wait=True, cancel_futures=True)
 
 
 class Producer(Thread):
     def __init__(self, handle):
         """
         Initializes the Producer class to read readings from csv file.
+        The producer parses chunks of the csv file, converts them into readings and
+        puts them into the bounded readings queue.
         Args:
             handle: The configuration of the plugin
         """
-        super(Producer, self).__init__()
-        self.handle = handle
-        self.max_capacity = MAX_QUEUE_CHUNK_CAPACITY
-
+        super(Producer, self).__init__(name='CSVProducer')
         self.handle = handle
 
     def run(self):
-        global readingsQueue, reader
+        try:
+            if source_set is not None:
+                self.run_sources()
+            else:
+                self.run_reader()
+        finally:
+            self.stop()
 
-        while not reader.shutdown_plugin:
+    def run_reader(self):
+        """ Puts the readings of the csv files, chunk by chunk, into the readings queue """
+        global reader, wait_event
+        while not reader.shutdown_plugin and not wait_event.is_set():
 
             if not reader.current_csv_file:
-                _LOGGER.info("No file found yet. Waiting...")
-                time.sleep(5)
+                _LOGGER.debug("No file found yet. Waiting...")
+                reader.file_event.wait(0.5)
+                continue
+            chunk = reader.next_chunk()
+            if chunk is None:
                 continue
-            if not reader.df:
-                _LOGGER.info("File has been found. Playing it in async mode.")
-                reader.read_csv_file()
-            # If plugin shutdown has been called
-            global wait_event
-            if wait_event.is_set():
-                return
 
-            # Do not exceed maximum capacity of Queue
-            condition.acquire()
-            if len(readingsQueue) >= self.max_capacity:
-                condition.wait()
+            readings = reader.chunk_readings(chunk)
+            if readings:
+                self.put(readings, reader.position() if reader.checkpoint is not None else None)
 
-            try:
-                chunk = next(reader.df)
-                readingsQueue.append(chunk)
-            except StopIteration:
+    def run_sources(self):
+        """ Puts the readings of all sources, merged in timestamp order, into the readings queue """
+        global source_set, wait_event
+        while not wait_event.is_set():
+            readings = source_set.take(source_set.chunk_size)
+            if not readings and source_set.merging:
+                continue
+            if not readings:
+                _LOGGER.debug("No source has a file to play. Waiting...")
+                wait_event.wait(0.5)
+                continue
+            self.put(readings)
 
-                _LOGGER.info('End of file reached.')
-
-                if self.handle['postProcessMethod']['value'] == 'continue_playing':
-                    # reload csv file
-                    _LOGGER.info('Replaying it')
-                elif self.handle['postProcessMethod']['value'] == 'delete':
-                    _LOGGER.info('Deleting the csv file it')
-                    os.remove(reader.current_csv_file)
-                elif self.handle['postProcessMethod']['value'] == 'rename':
-                    _LOGGER.info('Renaming the csv file with suffix {}'.format(self.handle['suffixName']['value']))
-                    rename_name = reader.current_csv_file + self.handle['suffixName']['value']
-                    os.rename(reader.current_csv_file, rename_name)
-
-                if self.handle['postProcessMethod']['value'] != 'continue_playing':
-                    # Reset the current file.
-                    reader.current_csv_file = None
-                    reader.df = None
-
-                    # start the finder thread once again.
-                    reader.start_finder_thread()
-
-                    time.sleep(5)
-
-                # load the file once again.
-                reader.read_csv_file()
-                # fetch readings from it.
-                if reader.df:
-                    _LOGGER.info("The next file loaded. Playing it...")
-                    chunk = next(reader.df)
-                    readingsQueue.append(chunk)
-                else:
-                    _LOGGER.info("The next file could not be loaded. Waiting")
-                    time.sleep(5)
-                    continue
+    def put(self, readings, position=None):
+        """ Blocks while the queue is full, so that parsing stays at most queueDepth chunks ahead of ingest.
+        Args:
+            readings: The readings of a chunk
+            position: Playback position after the chunk, for the checkpoint, if any
+        """
+        global readingsQueue, wait_event
+        while not wait_event.is_set():
+            try:
+                readingsQueue.put((readings, position), timeout=0.5)
+                return
+            except queue.Full:
+                continue
 
-            # Notifying the consumer that data has been read.
-            condition.notify()
-            condition.release()
+    def stop(self):
+        """ Tells the consumer that no more readings will come, so that it stops without waiting for the
+        queue. If the queue is full, the consumer is not waiting for it and sees the shutdown on its own.
+        """
+        global readingsQueue
+        try:
+            readingsQueue.put_nowait(_sentinel)
+        except queue.Full:
+            pass
 
 
 class Consumer(Thread):
     def __init__(self, handle):
-        super(Consumer, self).__init__()
+        """
+        Initializes the Consumer class which ingests the readings prepared by the producer.
+        Args:
+            handle: The configuration of the plugin
+        """
+        super(Consumer, self).__init__(name='CSVConsumer')
         self.handle = handle
 
     def run(self):
-        global readingsQueue, reader
-
-        # Initialize the current time required for time stamp delta if required
+        global readingsQueue, reader, source_set, wait_event, metrics
 
-        period = float(self.handle['burstInterval']['value']) / 1000.0 if self.handle['ingestMode']['value'] == 'burst' \
-            else 1
-        count = 0
-        n_readings = 0
-        org_start_time = datetime.datetime.now()
+        scheduler = source_set.scheduler if source_set is not None else reader.scheduler
 
-        while not reader.shutdown_plugin:
-            # Check if shutdown is called
-
-            if not reader.current_csv_file:
-                time.sleep(5)
+        while not wait_event.is_set():
+            try:
+                item = readingsQueue.get(timeout=0.5)
+            except queue.Empty:
                 continue
-            global wait_event
-            if wait_event.is_set():
-                return
-
-            # Check if queue is empty
-            condition.acquire()
-            if len(readingsQueue) == 0:
-                condition.wait()
-            start_time = datetime.datetime.now()
-
-            chunk = readingsQueue.pop(0)
-            if chunk is _sentinel:
-                readingsQueue.append(_sentinel)
+            if item is _sentinel:
                 break
-
-            for readings in reader.chunk_to_readings(chunk):
-                # Ingest into database
-                # print("consumer: ingest ", readings)
-                count += 1
-                n_readings += 1 if (type(readings) == dict) else len(readings)
-                async_ingest.ingest_callback(c_callback, c_ingest_ref, readings)
-
-            end_time = datetime.datetime.now()
-
-            if TIME_IT and (n_readings % 10000) == 0:
-                duration = (end_time - org_start_time).total_seconds()
-                print(f"start: {start_time}")
-                print("end: {} readings, {} ({:.3f} total sec)".format(n_readings, end_time, duration))
-                print("end: {} per poll, {:.3f} polls/sec, {:.3f} readings/sec".format(duration / count,
-                                                                                       count / duration,
-                                                                                       n_readings / duration))
-
-            # Notifying the Producer
-            condition.notify()
-            condition.release()
-
-            # Wait for a fixed interval of time
-            timeout = max(period - (end_time - start_time).total_seconds(), 0.0)
-            wait_event.wait(timeout=timeout)
+            readings, position = item
+            # Ingest into database in micro-batches (a burst at once), each when it is due
+            for i in range(0, len(readings), scheduler.batch_size):
+                if scheduler.wait(wait_event):
+                    return
+                batch = readings[i:i + scheduler.batch_size]
+                start = time.perf_counter()
+                token = metrics.enter('ingest')
+                try:
+                    async_ingest.ingest_callback(c_callback, c_ingest_ref, batch)
+                finally:
+                    metrics.leave(token)
+                metrics.add(emitted=len(batch), ingest_calls=1, ingest=time.perf_counter() - start)
+                scheduler.done(len(batch))
+            if position is not None:
+                reader.checkpoint.commit(position)
+
+            stats = metrics.report(scheduler, readingsQueue.qsize())
+            if stats is not None:
+                async_ingest.ingest_callback(c_callback, c_ingest_ref, [stats])
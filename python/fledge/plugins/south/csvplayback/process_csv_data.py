@@ -1,153 +1,437 @@
 import pandas as pd
 import os
 import argparse
+import io
+import json
+import re
 import sys
 import numpy as np
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
-_FLEDGE_ROOT = os.getenv("FLEDGE_ROOT", default='/usr/local/fledge')
-if not os.path.exists(_FLEDGE_ROOT):
-    print('Make sure FLEDGE_ROOT exist')
-    sys.exit(1)
+try:
+    # faster JSON decoder, if installed
+    from orjson import loads as _json_loads
+except ImportError:
+    _json_loads = json.loads
 
+_FLEDGE_ROOT = os.getenv("FLEDGE_ROOT", default='/usr/local/fledge')
 _FLEDGE_DATA = os.path.expanduser(_FLEDGE_ROOT + '/data')
+# Binary columnar sidecar read by the csvplayback plugin, see ColumnarSidecar in csvplayback.py
+_SIDECAR_SUFFIX = '.npcols'
+_SIDECAR_SCHEMA_SUFFIX = '.npcols.json'
+_SIDECAR_VERSION = 1
+# a missing value, as in {"channel1":,"channel2":0.0071383551}
+_EMPTY_VALUE = re.compile(r':\s*(?=[,}])')
 
 """
-Usage 
-python3 process_csv_data.py --input_file_name vibe-2019-12-12.csv --output_file_name vibration.csv --chunksize 10000
-or 
-python3 process_csv_data.py --input_file_name vibe-2019-12-12.csv --output_file_name vibration.csv --chunksize 10000 --choice fill --method linear
+Usage
+python3 process_csv_data.py --input_file_name vibe-2019-12-12.csv --output_file_name vibration.csv
+or
+python3 process_csv_data.py --input_file_name vibe-2019-12-12.csv --output_file_name vibration.csv --choice fill --method linear
+or, to also write a binary columnar sidecar (vibration.csv.npcols) in chunks of 10000 rows, that the plugin plays
+instead of parsing the csv file
+python3 process_csv_data.py --input_file_name vibe-2019-12-12.csv --output_file_name vibration.csv --sidecar --sidecar_chunksize 10000
+or, with 4 worker processes, each one converting 32 MB of the input file at a time
+python3 process_csv_data.py --input_file_name vibe-2019-12-12.csv --output_file_name vibration.csv --workers 4 --block_size 32
 
+The input file is cut into blocks of lines which are converted in parallel and written in order, every line of
+the input file must hold one row.
 
 """
 
-ap = argparse.ArgumentParser()
-ap.add_argument("-i", "--input_file_name", required=True,
-                help="Name of input_file")
-ap.add_argument("-o", "--output_file_name", required=True,
-                help="File name of processed file")
-ap.add_argument("-c", "--chunksize", type=int, default=10000,
-                help="Chunk size")
-ap.add_argument("-C", "--choice", type=str, default='ignore',
-                help="Fill or drop or ignore NaN values")
-ap.add_argument("-m", "--method", type=str, default='linear',
-                help="method for filling data")
 
-args = vars(ap.parse_args())
+def split_ranges(csv_in_path, block_size):
+    """
+    Cuts a csv file into byte ranges of whole lines.
+    Args:
+        csv_in_path: Name of input_file (Full path)
+        block_size: Bytes per range, a range ends at the end of the line found there
+
+    Returns: tuple of the header line and the list of (start, end) byte ranges of the rows
+
+    """
+    ranges = []
+    with open(csv_in_path, 'rb') as fd:
+        header = fd.readline()
+        size = os.fstat(fd.fileno()).st_size
+        start = fd.tell()
+        while start < size:
+            fd.seek(min(start + block_size, size))
+            fd.readline()
+            end = fd.tell()
+            ranges.append((start, end))
+            start = end
+    return header, ranges
+
+
+def parse_reading(text):
+    """
+    Parses a reading like {"channel1":0.0083912037,"channel2":0.0071383551}. A missing value, as in
+    {"channel1":,"channel2":0.0071383551}, is given as None.
+    """
+    if not isinstance(text, str):
+        return {}
+    try:
+        return _json_loads(text)
+    except ValueError:
+        pass
+    try:
+        return _json_loads(_EMPTY_VALUE.sub(':null', text))
+    except ValueError:
+        items = (item.split(':', 1) for item in text.strip().strip('{}').split(',') if ':' in item)
+        return {key.strip().strip('"'): value.strip() for key, value in items}
+
+
+class ColumnPlan:
+    """
+    The columns extracted from the readings of a file: one column per value, the values of nested objects
+    named by their path, like 'axis.x', and the type of every column. The plan is inferred from the first rows of
+    the file, values of keys not found there are not extracted.
+    """
+    SEPARATOR = '.'
+
+    def __init__(self, columns):
+        """
+        Args:
+            columns: list of (path, type) of the columns, path the tuple of the keys of the value and type
+                int64, float64 or str
+        """
+        self.columns = columns
+        self.names = [self.SEPARATOR.join(path) for path, _ in columns]
+        self.numeric = [name for name, (_, kind) in zip(self.names, columns) if kind != 'str']
+        self.flat = all(len(path) == 1 for path, _ in columns)
+
+    @classmethod
+    def infer(cls, texts):
+        """
+        Infers the plan of a sample of readings
+        Args:
+            texts: The readings, as JSON text
+        Returns:
+            ColumnPlan
+        """
+        types = {}
+        for text in texts:
+            reading = parse_reading(text)
+            if isinstance(reading, dict):
+                for path, value in cls.flatten(reading):
+                    types[path] = cls.merge(types.get(path), value)
+        return cls([(path, kind or 'float64') for path, kind in types.items()])
+
+    @classmethod
+    def flatten(cls, reading, prefix=()):
+        """ Yields (path, value) of every value of a reading """
+        for key, value in reading.items():
+            if isinstance(value, dict) and value:
+                yield from cls.flatten(value, prefix + (str(key),))
+            else:
+                yield prefix + (str(key),), value
+
+    @staticmethod
+    def merge(kind, value):
+        """ Returns the type of a column holding the values of type kind and the value """
+        if value is None or value == '' or kind == 'str':
+            return kind
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            if isinstance(value, str):
+                try:
+                    float(value)
+                    return kind if kind == 'int64' and value.lstrip('+-').isdigit() else 'float64'
+                except ValueError:
+                    pass
+            return 'str'
+        if isinstance(value, int) and kind in [None, 'int64']:
+            return 'int64'
+        return 'float64'
+
+    def extract(self, texts):
+        """
+        Extracts the columns of readings. A missing value is NaN in a numeric column, '' in a text column,
+        an int64 column with missing values is given as float64.
+        Args:
+            texts: The readings, as JSON text
+        Returns:
+            dict of the numpy array of every column, by name
+        """
+        texts = list(texts)
+        try:
+            # one call to the decoder for all the readings
+            readings = _json_loads('[' + ','.join(texts) + ']')
+        except (TypeError, ValueError):
+            readings = [parse_reading(text) for text in texts]
+        readings = [reading if isinstance(reading, dict) else {} for reading in readings]
+
+        arrays = {}
+        for (path, kind), name in zip(self.columns, self.names):
+            if len(path) == 1:
+                key = path[0]
+                values = [reading.get(key) for reading in readings]
+            else:
+                values = [self.lookup(reading, path) for reading in readings]
+            arrays[name] = self.typed(values, kind)
+        return arrays
+
+    @staticmethod
+    def lookup(reading, path):
+        for key in path:
+            if not isinstance(reading, dict):
+                return None
+            reading = reading.get(key)
+        return reading
+
+    @staticmethod
+    def typed(values, kind):
+        """ Returns the numpy array of the values of a column """
+        if kind == 'str':
+            return np.array(['' if value is None else value if isinstance(value, str) else json.dumps(value)
+                             for value in values], dtype=object)
+        try:
+            array = np.array(values, dtype='float64')
+        except (TypeError, ValueError):
+            array = pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').to_numpy(dtype='float64')
+        if kind == 'int64' and not np.isnan(array).any():
+            return array.astype('int64')
+        return array
+
+
+def convert_rows(data, keys):
+    """
+    Rewrites raw rows 'reading,user_ts' holding the given channels, in this order, as rows
+    'channel1,channel2,...,user_ts', by replacing the bytes around the values.
+    Args:
+        data: The rows
+        keys: The channels
+
+    Returns: the rows rewritten, None if a row is not written as expected
+
+    """
+    n_rows = data.count(b'\n') + (not data.endswith(b'\n'))
+    tokens = [(b'"{""' + keys[0].encode() + b'"":', b'')] + \
+             [(b',""' + key.encode() + b'"":', b',') for key in keys[1:]] + [(b'}",', b',')]
+    for token, replacement in tokens:
+        size = len(data)
+        data = data.replace(token, replacement)
+        # every row holds the token once
+        if size - len(data) != n_rows * (len(token) - len(replacement)):
+            return None
+    if data.count(b',') != n_rows * len(keys) or b'"' in data:
+        return None
+    return data
+
+
+def infer_plan(csv_in_path, sample_rows=1000):
+    """
+    Infers the column plan of the readings of a raw csv file from its first rows
+    Args:
+        csv_in_path: Name of input_file (Full path)
+        sample_rows: Number of rows sampled
+
+    Returns: ColumnPlan
+
+    """
+    sample = pd.read_csv(csv_in_path, nrows=sample_rows, dtype=str, keep_default_na=False)
+    return ColumnPlan.infer(sample['reading'])
+
+
+def convert_range(task):
+    """
+    Converts a byte range of a raw csv file of format like "{""channel1"":0.0083912037,""channel2"":0.0071383551}"
+    to rows like 0.0083912037,0.0071383551. Runs in a worker process.
+    Args:
+        task: tuple of the input file, the byte range, the header line, the column plan, the output columns,
+            the choice and the method for NaN values
+
+    Returns: the csv text of the rows, without header
 
-out_file_name = args['output_file_name']
-in_file_name = args['input_file_name']
-csv_out_path = '{}/{}'.format(_FLEDGE_DATA, out_file_name)
-csv_in_path = '{}/{}'.format(_FLEDGE_DATA, in_file_name)
+    """
+    csv_in_path, start, end, header, plan, columns, choice, method = task
+    keys = plan.names
+    with open(csv_in_path, 'rb') as fd:
+        fd.seek(start)
+        data = fd.read(end - start)
+
+    df = None
+    if header.strip() == b'reading,user_ts' and keys and plan.flat:
+        # no row is parsed in Python, unless a row is written in another way
+        converted = convert_rows(data, keys)
+        if converted is not None:
+            if choice == 'ignore':
+                return converted
+            df = pd.read_csv(io.BytesIO(converted), header=None, names=columns, dtype={'user_ts': str})
+
+    if df is None:
+        raw = pd.read_csv(io.BytesIO(header + data), dtype=str, keep_default_na=False)
+        df = pd.DataFrame(plan.extract(raw['reading']))
+        for col_name in columns[len(keys):]:
+            df[col_name] = raw[col_name].to_numpy()
+
+    if choice != 'ignore':
+        df = remove_nan(df, plan.numeric, choice, method)
+    return df.to_csv(index=False, header=False).encode()
+
+
+def remove_nan(df, keys, choice='fill', method='linear'):
+    """
+    Removes NaN from the channels of a block of rows. Every block is filled on its own, the fillNaN option
+    of the plugin fills the values while the file is played and interpolates across chunks.
+    Args:
+        df: The rows converted
+        keys: The channels
+        choice: Whether to fill the values or drop the rows.
+        method: interpolation methods like linear, cubic, nearest and sliding window methods like
+           rolling mean and rolling median.
 
-if not os.path.exists(csv_in_path):
-    print('The input file does not exist')
-    sys.exit(1)
+    Returns: the rows, without NaN unless a channel has no value in the block
 
-if os.path.exists(csv_out_path):
-    print('The converted file already exists change the output file name or delete the earlier converted file.')
-    sys.exit(1)
+    """
+    for col_name in keys:
+        # white spaces and missing values become NaN's
+        df[col_name] = pd.to_numeric(df[col_name], errors='coerce')
+    if choice != 'fill':
+        return df.dropna(subset=keys)
 
-chunksize = args['chunksize']
-choice = args['choice']
-method = args['method']
+    for col_name in keys:
+        if not df[col_name].isnull().values.any():
+            continue
+        if method == 'linear' or method == 'cubic' or method == 'nearest':
+            df[col_name] = df[col_name].interpolate(method=method, limit_direction='both')
+        elif method == 'rolling_mean':
+            df[col_name] = df[col_name].fillna(df[col_name].rolling(2, min_periods=1).mean())
+        elif method == 'rolling_median':
+            df[col_name] = df[col_name].fillna(df[col_name].rolling(2, min_periods=1).median())
+    return df
 
 
-def get_clean_csv_file(csv_in_path, csv_out_path, chunksize=10000):
+def get_clean_csv_file(csv_in_path, csv_out_path, choice='ignore', method='linear', workers=1,
+                       block_size=16 * 1024 * 1024, sample_rows=1000):
     """
     Converts a raw csv file of format like "{""channel1"":0.0083912037,""channel2"":0.0071383551}"
     to a format like    channel1,    channel2
                         0.0083912037,0.0071383551
+    for any number of channels, nested values being named by their path, like axis.x. The columns and their
+    types are inferred from the first rows. The file is cut into blocks of lines converted by a pool of processes,
+    and written in order.
     Args:
         csv_in_path: Name of input_file (Full path)
         csv_out_path: Full File path of processed file (will be stored in same directory as input file)
-        chunksize: The chunk size required to process the csv file
+        choice: Whether to fill or drop or ignore NaN values
+        method: method for filling data
+        workers: Number of worker processes
+        block_size: Bytes of the input file converted at a time by a worker
+        sample_rows: Number of rows the columns are inferred from
 
     Returns: None
 
     """
-    df_iter = pd.read_csv(csv_in_path, chunksize=chunksize, iterator=True)
-    i = 0
-    while True:
-        try:
-            if i == 0:
-                df = next(df_iter)
-                df['channel1'] = df['reading'].apply(lambda x: x.split(",")[0].split(":")[1])
-                df['channel2'] = df['reading'].apply(lambda x: x.split(",")[1].split(":")[1].split("}")[0])
-                df[['channel1', 'channel2', 'user_ts']].to_csv(csv_out_path, mode='a', index=False)
-            else:
-                df = next(df_iter)
-                df['channel1'] = df['reading'].apply(lambda x: x.split(",")[0].split(":")[1])
-                df['channel2'] = df['reading'].apply(lambda x: x.split(",")[1].split(":")[1].split("}")[0])
-                df[['channel1', 'channel2', 'user_ts']].to_csv(csv_out_path, mode='a', index=False, header=None)
-            i += 1
-        except StopIteration:
-            break
+    header, ranges = split_ranges(csv_in_path, block_size)
+    plan = infer_plan(csv_in_path, sample_rows)
+    in_columns = pd.read_csv(io.BytesIO(header), nrows=0).columns
+    columns = plan.names + [col_name for col_name in in_columns if col_name != 'reading']
+    tasks = ((csv_in_path, start, end, header, plan, columns, choice, method) for start, end in ranges)
+
+    with open(csv_out_path, 'wb') as out:
+        out.write((','.join(columns) + '\n').encode())
+        if workers <= 1:
+            for task in tasks:
+                out.write(convert_range(task))
+            return
 
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # keep a few blocks ahead of the writer, memory does not grow with the size of the file
+            pending = deque()
+            for task in tasks:
+                pending.append(pool.submit(convert_range, task))
+                if len(pending) >= 2 * workers:
+                    out.write(pending.popleft().result())
+            while pending:
+                out.write(pending.popleft().result())
 
-def remove_nan_from_csv(csv_in_path, csv_out_path, chunksize=8000, choice='fill', method='linear'):
+
+def write_sidecar(csv_path, chunksize=10000):
     """
-    Removes NaN from the csv file and stores the modified file in specified location.
+    Writes the binary columnar sidecar of a csv file next to it. For every chunk of the csv file, the values
+    of every column, as typed when pandas reads the file, are stored as a .npy record. Text is stored as fixed
+    width unicode, missing text as ''. A JSON schema holds the column names, the number of chunks and the
+    size and modification time of the csv file, so that a sidecar not matching the csv file is ignored.
     Args:
-        csv_in_path: Name of input_file (Full path)
-        csv_out_path: Full File path of processed file (will be stored in same directory as input file)
-        chunksize: The chunk size required to process the csv file
-        choice: Whether to fill or drop the data.
-        method: interpolation methods like linear, cubic, nearest and sliding window methods like
-           rolling mean and rolling median.
+        csv_path: Full path of the csv file
+        chunksize: No. of rows per chunk of the sidecar
 
     Returns: None
 
     """
-    df_iter = pd.read_csv(csv_in_path, chunksize=chunksize, iterator=True)
-    i = 0
-    while True:
-        try:
+    columns = []
+    n_chunks = 0
+    n_rows = 0
+    with open(csv_path + _SIDECAR_SUFFIX, 'wb') as fd:
+        for df in pd.read_csv(csv_path, chunksize=chunksize, iterator=True):
+            columns = list(df.columns)
+            for i in range(df.shape[1]):
+                values = df.iloc[:, i]
+                if values.dtype == object:
+                    values = values.fillna('').astype(str).to_numpy(dtype=str)
+                np.save(fd, np.asarray(values), allow_pickle=False)
+            n_chunks += 1
+            n_rows += len(df)
 
-            df = next(df_iter)
-            original_column_list = df.columns
-            for col_name in df.columns:
-                is_nan = df[col_name].isnull().values.any()  # check if NaN values
-
-                is_blank = df[col_name].astype(str).str.isspace().any()  # check if blank values are there
-
-                all_values_null_or_blank = df[col_name].isnull().values.all() or \
-                                           df[col_name].astype(str).str.isspace().all()
-                if is_nan or is_blank:
-                    if not all_values_null_or_blank:
-                        if is_blank:
-                            # convert white spaces to NaN's
-                            df[col_name].replace(r'^\s*$', np.nan, regex=True, inplace=True)
-                        if choice == 'fill':
-                            df[col_name] = df[col_name].astype('float64')
-                            fill_method = method
-
-                            if fill_method == 'linear' or fill_method == 'cubic' or fill_method == 'nearest':
-                                df[col_name].interpolate(method=fill_method, inplace=True,
-                                                         limit_direction='both')
-
-                            elif fill_method == 'rolling_mean':
-                                df[col_name].fillna(df[col_name].rolling(2, min_periods=1).mean(),
-                                                    inplace=True)
-
-                            elif fill_method == 'rolling_median':
-                                df[col_name].fillna(df[col_name].rolling(2, min_periods=1).median(),
-                                                    inplace=True)
-                        else:
-                            original_column_list.remove(col_name)
-                    else:
-                        # Drop everything in this column
-                        original_column_list.remove(col_name)
-
-            if i == 0:
-                df[original_column_list].to_csv(csv_out_path, mode='a', index=False)
-            else:
-                df[original_column_list].to_csv(csv_out_path, mode='a', index=False, header=None)
+    stat = os.stat(csv_path)
+    schema = {
+        'version': _SIDECAR_VERSION,
+        'columns': columns,
+        'chunks': n_chunks,
+        'rows': n_rows,
+        'source': {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    }
+    with open(csv_path + _SIDECAR_SCHEMA_SUFFIX, 'w') as fd:
+        json.dump(schema, fd)
+
+
+def main():
+    if not os.path.exists(_FLEDGE_ROOT):
+        print('Make sure FLEDGE_ROOT exist')
+        sys.exit(1)
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-i", "--input_file_name", required=True,
+                    help="Name of input_file")
+    ap.add_argument("-o", "--output_file_name", required=True,
+                    help="File name of processed file")
+    ap.add_argument("-c", "--sidecar_chunksize", type=int, default=10000,
+                    help="No. of rows per chunk of the sidecar written with --sidecar")
+    ap.add_argument("-C", "--choice", type=str, default='ignore',
+                    help="Fill or drop or ignore NaN values, drop removes the rows with NaN values")
+    ap.add_argument("-m", "--method", type=str, default='linear',
+                    help="method for filling data")
+    ap.add_argument("-s", "--sidecar", action='store_true',
+                    help="Also write a binary columnar sidecar of the processed file")
+    ap.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 1,
+                    help="Number of worker processes")
+    ap.add_argument("-b", "--block_size", type=int, default=16,
+                    help="Megabytes of the input file converted at a time by a worker")
+    ap.add_argument("-S", "--sample_rows", type=int, default=1000,
+                    help="Number of rows the columns of the readings are inferred from")
+
+    args = vars(ap.parse_args())
+
+    out_file_name = args['output_file_name']
+    in_file_name = args['input_file_name']
+    csv_out_path = '{}/{}'.format(_FLEDGE_DATA, out_file_name)
+    csv_in_path = '{}/{}'.format(_FLEDGE_DATA, in_file_name)
+
+    if not os.path.exists(csv_in_path):
+        print('The input file does not exist')
+        sys.exit(1)
+
+    if os.path.exists(csv_out_path):
+        print('The converted file already exists change the output file name or delete the earlier converted file.')
+        sys.exit(1)
 
-            i += 1
-        except StopIteration:
-            break
+    get_clean_csv_file(csv_in_path, csv_out_path, args['choice'], args['method'], args['workers'],
+                       args['block_size'] * 1024 * 1024, args['sample_rows'])
+    if args['sidecar']:
+        write_sidecar(csv_out_path, args['sidecar_chunksize'])
 
 
-get_clean_csv_file(csv_in_path, csv_out_path, chunksize)
-if method != 'ignore':
-    remove_nan_from_csv(csv_in_path, csv_out_path, chunksize, choice, method)
+if __name__ == '__main__':
+    main()
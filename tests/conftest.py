@@ -0,0 +1,37 @@
+""" Runs the plugin outside of Fledge, with the stand-in Fledge modules of benchmarks/stubs """
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(_HERE, '..', 'benchmarks', 'stubs'), os.path.join(_HERE, '..', 'python')]
+# the data directory of the plugin, for its checkpoints and profiles
+os.environ['FLEDGE_ROOT'] = tempfile.mkdtemp(prefix='csvplayback-tests-')
+
+from fledge.plugins.south.csvplayback import csvplayback
+
+
+@pytest.fixture
+def plugin(monkeypatch):
+    """ The plugin module with unpaced playback, shut down after the test """
+    def unpaced(scheduler, event):
+        scheduler.owed()  # starts the schedule
+        return event.is_set()
+
+    monkeypatch.setattr(csvplayback.PacingScheduler, 'wait', unpaced)
+    handles = []
+    yield csvplayback, handles
+    for handle in handles:
+        csvplayback.plugin_shutdown(handle)
+
+
+@pytest.fixture
+def config(tmp_path):
+    """ The default configuration, playing the files of tmp_path """
+    config = {name: {'value': item['default']} for name, item in csvplayback.plugin_info()['config'].items()}
+    config['csvDirName']['value'] = str(tmp_path)
+    config['metricsInterval']['value'] = '0'
+    return config
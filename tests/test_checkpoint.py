@@ -0,0 +1,28 @@
+import json
+import os
+
+import pandas as pd
+
+
+def test_poll_resumes_after_the_readings_returned(plugin, config, tmp_path):
+    csvplayback, handles = plugin
+    pd.DataFrame({'v': range(200)}).to_csv(tmp_path / 'rows.csv', index=False)
+    config['assetName']['value'] = 'resume'
+    config['csvFileName']['value'] = 'rows'
+    config['ingestMode']['value'] = 'burst'
+    config['burstInterval']['value'] = '1000'
+    config['sampleRate']['value'] = '10'
+    config['checkpointInterval']['value'] = '3600'
+    checkpoint = os.path.join(csvplayback._FLEDGE_DATA, 'csvplayback', 'checkpoints', 'resume.json')
+
+    handle = csvplayback.plugin_init(config)
+    returned = []
+    for _ in range(12):
+        returned += [r['readings']['v'] for r in csvplayback.plugin_poll(handle)]
+    csvplayback.plugin_shutdown(handle)
+    assert returned == list(range(120))
+    with open(checkpoint) as fd:
+        assert json.load(fd)['rows'] == 120
+
+    handles.append(csvplayback.plugin_init(config))
+    assert [r['readings']['v'] for r in csvplayback.plugin_poll(handles[0])] == list(range(120, 130))
@@ -0,0 +1,27 @@
+import json
+
+import pandas as pd
+
+
+def test_sources_ignore_array_datapoints(plugin, config, tmp_path):
+    csvplayback, handles = plugin
+    for name in ['first', 'second']:
+        pd.DataFrame({name: range(10)}).to_csv(tmp_path / (name + '.csv'), index=False)
+    config['ingestMode']['value'] = 'burst'
+    config['burstInterval']['value'] = '1000'
+    config['sampleRate']['value'] = '10'
+    config['arrayDatapoints']['value'] = 'true'
+    config['postProcessMethod']['value'] = 'continue_playing'
+    config['sources']['value'] = json.dumps({'sources': [{'assetName': 'first', 'csvFileName': 'first'},
+                                                         {'assetName': 'second', 'csvFileName': 'second',
+                                                          'arrayDatapoints': 'true'}]})
+    handles.append(csvplayback.plugin_init(config))
+
+    source_set = csvplayback.source_set
+    assert [r.handle['arrayDatapoints']['value'] for r in source_set.readers] == ['false', 'false']
+    # a burst of every source per burst interval, one reading per row
+    assert source_set.scheduler.rate == 20
+    readings = csvplayback.plugin_poll(handles[0])
+    assert len(readings) == 20
+    assert sorted((r['asset'], r['readings'][r['asset']]) for r in readings) == \
+        [(name, value) for name in ['first', 'second'] for value in range(10)]